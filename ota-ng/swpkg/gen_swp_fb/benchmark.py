@@ -0,0 +1,236 @@
+'''Benchmarks for the package generator
+
+Usage:
+
+    benchmark.py <benchmark> [options]
+
+Benchmarks:
+
+    io      Run gen_swp_fb.py in process and report bytes read and written per
+            output byte (Linux only, uses /proc/self/io) and the peak resident
+            memory. Everything after the benchmark name is handed to
+            gen_swp_fb.py.
+
+    sign    RSA2048 signatures per second, parsing the DER key for every
+            signature versus reusing the parsed key of the key store.
+            Options: --key-store <dir> --count <n>
+
+    compress
+            Compression ratio against throughput of every available backend
+            on the given artefacts, compressing the whole stream and chunk
+            by chunk. Options: --block-size <n> --profile <fast|balanced|max>
+            <artefact> [<artefact> ...]
+
+    blocks  Time and memory per 100k blocks: generating all BLOCK objects of
+            an artefact at once, against generating them lazily while they
+            are checksummed and written (signatures are not computed), then
+            the size and block positions of the written list. The lazy path
+            is run with the header records kept as objects and, when numpy
+            is installed, in a numpy Table.
+            Options: --count <n> --block-size <n>
+
+Example:
+    benchmark.py io --configfile my_swp.json
+    benchmark.py sign --key-store keys/ --count 200
+    benchmark.py compress --block-size 60000 artefact_1 artefact_2
+    benchmark.py blocks --count 100000
+'''
+
+import os
+import sys
+import json
+import runpy
+import importlib
+import argparse
+import hashlib
+import time
+import resource
+import tracemalloc
+
+
+GEN_SWP_FB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gen_swp_fb.py')
+
+###############################################################################
+
+def io_counters():
+    ''' Returns (bytes read, bytes written) by this process so far '''
+    with open('/proc/self/io', 'r') as f:
+        counters = dict(line.split(': ') for line in f.read().splitlines())
+    return (int(counters['rchar']), int(counters['wchar']))
+
+def output_path(argv):
+    ''' Output file of a gen_swp_fb.py run, from command line or config file '''
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--output", type=str, default="swpkg.bin")
+    parser.add_argument("--configfile", type=str)
+    args, _ = parser.parse_known_args(argv)
+    if args.configfile is not None:
+        with open(args.configfile, 'r') as cfFile:
+            return json.loads(cfFile.read()).get('output', args.output)
+    return args.output
+
+def preload():
+    ''' Import generator modules up front so imports are not measured '''
+    if os.path.dirname(GEN_SWP_FB) not in sys.path:
+        sys.path.insert(0, os.path.dirname(GEN_SWP_FB))
+    for module in ('swp', 'pkg', 'bufferio', 'flatbuf', 'gensignature', 'de_compress', 'magic'):
+        importlib.import_module(module)
+
+def run_generator(argv):
+    ''' Run gen_swp_fb.py in this process with the given arguments '''
+    preload()
+    sys.argv = [GEN_SWP_FB, *argv]
+    runpy.run_path(GEN_SWP_FB, run_name='__main__')
+
+###############################################################################
+
+def bench_io(argv):
+    preload()
+    (rd, wr) = io_counters()
+    run_generator(argv)
+    (rd_, wr_) = io_counters()
+    size = os.path.getsize(output_path(argv))
+    print(f'output size                : {size} bytes')
+    print(f'bytes read                 : {rd_ - rd} ({(rd_ - rd) / size:.3f} per output byte)')
+    print(f'bytes written              : {wr_ - wr} ({(wr_ - wr) / size:.3f} per output byte)')
+    print(f'peak resident memory       : {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss} kB')
+
+def bench_sign(argv):
+    parser = argparse.ArgumentParser(prog='benchmark.py sign')
+    parser.add_argument("--key-store", type=str, default="keys/", help="Path to the keystore, directory containing .der files")
+    parser.add_argument("--count", type=int, default=200, help="Number of signatures per measurement")
+    args = parser.parse_args(argv)
+    preload()
+    from gensignature import SignatureGen
+    sec = SignatureGen()
+    keys = sec.keystore(args.key_store)
+    der = keys.read(keys.PRIVATE_KEY)
+    digests = [hashlib.sha256(i.to_bytes(4, 'big')).digest() for i in range(args.count)]
+    for name, key in (('DER key per signature', der), ('parsed key store key', keys.private_key)):
+        start = time.perf_counter()
+        for digest in digests:
+            sec.generate_signature_rsa(key, digest)
+        elapsed = time.perf_counter() - start
+        print(f'{name:27}: {args.count / elapsed:.1f} signatures/s')
+
+def bench_compress(argv):
+    parser = argparse.ArgumentParser(prog='benchmark.py compress')
+    parser.add_argument("--block-size", type=int, default=768, help="chunk size for chunk by chunk compression")
+    parser.add_argument("--profile", type=str, help="compression profile: fast, balanced or max")
+    parser.add_argument("artefact", nargs='+', help="artefact files")
+    args = parser.parse_args(argv)
+    preload()
+    import de_compress
+    for path in args.artefact:
+        with open(path, 'rb') as f:
+            data = f.read()
+        chunks = [data[i:i + args.block_size] for i in range(0, len(data), args.block_size)]
+        print(f'{os.path.basename(path)} ({len(data)} bytes)')
+        print(f'    {"algorithm":10} {"mode":7} {"ratio":>7} {"compress MB/s":>14} {"decompress MB/s":>16}')
+        for name in de_compress.SAlgos:
+            if name == 'None':
+                continue
+            compressor = de_compress.Compress(name, args.profile)
+            # whole stream, as for compressWhole artefacts
+            start = time.perf_counter()
+            obj = compressor.compressionObj()
+            whole = b''.join(obj.compress(chunk) for chunk in chunks) + obj.flush()
+            c_time = time.perf_counter() - start
+            start = time.perf_counter()
+            compressor.decompressionObj().decompress(whole)
+            d_time = time.perf_counter() - start
+            print_compress_row(name, 'whole', len(data), len(whole), c_time, d_time)
+            # chunk by chunk, keeping the raw chunk if compression does not pay off, as for compressChunks artefacts
+            start = time.perf_counter()
+            packed = [compressor.compress_data(chunk) for chunk in chunks]
+            c_time = time.perf_counter() - start
+            start = time.perf_counter()
+            for c_chunk, chunk in zip(packed, chunks):
+                if len(c_chunk) < len(chunk):
+                    compressor.decompress_data(c_chunk)
+            d_time = time.perf_counter() - start
+            size = sum(min(len(c_chunk), len(chunk)) for c_chunk, chunk in zip(packed, chunks))
+            print_compress_row(name, 'chunks', len(data), size, c_time, d_time)
+
+def print_compress_row(name, mode, size, c_size, c_time, d_time):
+    mb = size / 10**6
+    print(f'    {name:10} {mode:7} {size / c_size:7.2f} {mb / c_time:14.1f} {mb / max(d_time, 1e-9):16.1f}')
+
+def bench_blocks(argv):
+    parser = argparse.ArgumentParser(prog='benchmark.py blocks')
+    parser.add_argument("--count", type=int, default=100000, help="Number of blocks")
+    parser.add_argument("--block-size", type=int, default=64, help="data size of a block")
+    args = parser.parse_args(argv)
+    preload()
+    import pkg, bufferio, swp
+    from gensignature import SignatureGen
+    maps = {'hasher': None, 'compressor': None}
+    tag = pkg.ATAG(maps)
+    tag['CFV'].value = 0x0106
+    tag['BSS'].value = 256
+    spec = {'GROUP': 2,
+            'data': {'Type': bufferio.File,
+                     'args': {'data_kwargs': {'value': bytes(args.count * args.block_size)}, 'max_data_size': args.block_size}}}
+    per = 100000 / args.count
+    tracemalloc.start()
+    blocks = [*pkg.BLOCK.generator(tag, maps, None, spec)]
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del blocks
+    start = time.perf_counter()
+    blocks = [*pkg.BLOCK.generator(tag, maps, None, spec)]
+    elapsed = time.perf_counter() - start
+    print(f'blocks                     : {len(blocks)}')
+    print(f'generate all               : {elapsed * per:.3f} s per 100k blocks')
+    print(f'memory                     : {memory * per / 2**20:.1f} MB per 100k blocks ({memory / len(blocks):.0f} bytes per block)')
+    del blocks
+    # lazy generation as in a package: blocks exist while processed, header records are kept
+    tag['BHT'].value = swp.UCM.HashTypeDefinitions.SHA256.value
+    maps['hasher'] = swp.UCM.hasher_map_factory(SignatureGen())
+    signer = {'sign': lambda digest: bytes(256), 'size': 256}
+    def process():
+        blocks = bufferio.BList(False, None, pkg.BLOCK.generator(tag, maps, None, spec))
+        with bufferio.Output(os.devnull) as blocks.output:
+            blocks.process({'signer': signer, 'verifier': None})
+        return blocks
+    backends = [False, True] if bufferio.numpy is not None else [False]
+    for table in backends:
+        bufferio.BList.TABLE = table
+        print(f'header records kept in {"a numpy Table" if table else "HEAD objects"}:')
+        tracemalloc.start()
+        blocks = process()
+        (memory, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del blocks
+        start = time.perf_counter()
+        blocks = process()
+        elapsed = time.perf_counter() - start
+        print(f'  generate lazily and write: {elapsed * per:.3f} s per 100k blocks')
+        start = time.perf_counter()
+        blocks.update()
+        positions = [blocks.offset(seq) for seq in range(0, len(blocks), 1000)]
+        size = blocks.size
+        elapsed = time.perf_counter() - start
+        print(f'  layout, size, positions  : {elapsed * per * 1000:.3f} ms per 100k blocks ({size} bytes, {len(positions)} positions)')
+        start = time.perf_counter()
+        misplaced = blocks.misplaced()
+        elapsed = time.perf_counter() - start
+        print(f'  check block offsets      : {elapsed * per * 1000:.3f} ms per 100k blocks ({len(misplaced)} misplaced)')
+        print(f'  memory after process     : {memory * per / 2**20:.1f} MB per 100k blocks ({memory / len(blocks):.0f} bytes per block), peak {peak * per / 2**20:.1f} MB')
+        del blocks
+    bufferio.BList.TABLE = bufferio.numpy is not None
+
+###############################################################################
+
+BENCHMARKS = {
+    'io': bench_io,
+    'sign': bench_sign,
+    'compress': bench_compress,
+    'blocks': bench_blocks
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(__doc__)
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](sys.argv[2:])
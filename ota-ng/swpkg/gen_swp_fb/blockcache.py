@@ -0,0 +1,144 @@
+"""
+On disk cache of finished blocks, for incremental package rebuilds.
+
+An entry holds what a block costs to produce: the payload as written (the
+compressed chunk or the chunk itself), its CFLAG, CRC and signature. Entries
+are addressed by the SHA-256 of the raw chunk and of every parameter that
+goes into the block: container format, hash type, compression algorithm and
+settings, block size, key fingerprint, and the GROUP and SEQ header fields
+covered by CRC and signature. An unchanged artefact at the same place in a
+package therefore skips both compression and signing.
+
+A whole compressed artefact is one compressor stream, so its chunks are
+only known once the stream is compressed, and its block entries are keyed
+by their compressed payload instead. An artefact entry, keyed by the
+SHA-256 of the raw artefact and the same parameters, lists the keys of its
+blocks, so an unchanged artefact restores them all without compressing.
+It is stored next to them as <key>.keys.
+
+Entries are files named after their key, written atomically, so processes
+generating packages at the same time can share a cache directory. The file
+modification time is the LRU order: it is bumped on every hit, and `close`
+evicts the least recently used entries until the cache fits its size cap.
+"""
+
+import os
+import struct
+import hashlib
+
+
+class BlockCache:
+
+    HEADER = struct.Struct('>HLH')                                      # CFLAG, CRC, signature size
+
+    def __init__(self, path, max_size):
+        self.path     = path
+        self.max_size = max_size
+        self.hits     = 0
+        self.misses   = 0
+        self.stored   = 0
+        self.evicted  = 0
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(params, chunk):
+        hasher = hashlib.sha256(params.encode())
+        hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key):
+        ''' Returns (CFLAG, CRC, signature, payload) of a cached block, or None.
+            The caller counts the entry as a hit once it checked it, or rejects it '''
+        path = self.entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)                                              # most recently used
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        if len(data) < self.HEADER.size or len(data) < self.HEADER.size + self.HEADER.unpack_from(data)[2]:
+            self.reject(key)                                            # truncated
+            return None
+        (cflag, crc, sig_size) = self.HEADER.unpack_from(data)
+        start = self.HEADER.size + sig_size
+        return (cflag, crc, data[self.HEADER.size:start] or None, data[start:])
+
+    def get_keys(self, key):
+        ''' Returns the block keys of a cached artefact, or None if one of its blocks is gone '''
+        path = self.entry_path(key) + '.keys'
+        try:
+            with open(path, 'r') as f:
+                keys = f.read().split()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        if keys[-1:] != ['end']:                                        # truncated
+            return None
+        keys.pop()
+        if not all(os.path.exists(self.entry_path(k)) for k in keys):
+            return None
+        return keys
+
+    def put_keys(self, key, keys):
+        path = self.entry_path(key) + '.keys'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f'{path}.{os.getpid()}.tmp'
+        with open(temp, 'w') as f:
+            f.write('\n'.join(keys + ['end']))
+        os.replace(temp, path)
+
+    def hit(self):
+        self.hits += 1
+
+    def reject(self, key):
+        ''' Count a corrupt entry as a miss and delete it '''
+        self.misses += 1
+        try:
+            os.remove(self.entry_path(key))
+        except FileNotFoundError:                                       # rejected by another process
+            pass
+
+    def put(self, key, cflag, crc, sig, payload):
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        sig = sig or b''
+        temp = f'{path}.{os.getpid()}.tmp'
+        with open(temp, 'wb') as f:
+            f.writelines((self.HEADER.pack(cflag, crc, len(sig)), sig, payload))
+        os.replace(temp, path)
+        self.stored += 1
+
+    def close(self):
+        ''' Evict least recently used entries beyond the size cap '''
+        entries = []
+        for sub in os.scandir(self.path):
+            if sub.is_dir():
+                for entry in os.scandir(sub.path):
+                    if entry.name.endswith('.tmp'):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:                           # evicted by another process
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(entry[1] for entry in entries)
+        for (_, esize, path) in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+                self.evicted += 1
+            except FileNotFoundError:
+                pass
+            size -= esize
+        return size
+
+    def stats(self):
+        total = self.hits + self.misses
+        ratio = 100 * self.hits / total if total else 0
+        return (f'block cache: {self.hits} hits, {self.misses} misses ({ratio:.0f}% hit), '
+                f'{self.stored} stored, {self.evicted} evicted')
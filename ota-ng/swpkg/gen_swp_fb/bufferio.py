@@ -18,10 +18,21 @@ other abbreviations. See the `struct` module documentation for the details.
 
 import io
 import os
+import hashlib
 import json
 import struct
 import collections
+import operator
+import itertools
+import array
 import zlib
+import mmap
+from concurrent.futures import Future, ThreadPoolExecutor
+try:
+    import numpy
+except ImportError:                                 # optional, pip install numpy
+    numpy = None
+
 
 ###############################################################################
 
@@ -154,13 +165,18 @@ class Value:
         chunk = self.output.read(self.size)
         if len(chunk) == 0:
             raise EOFError(f'unexpected eof')
-        if isinstance(hasher, list):
-            hasher.append(chunk)
-        else :
-            hasher.update(chunk)
+        hasher.update(chunk)
 
     raw_hash = hash
 
+    def pack(self):
+        """Binary representation of python value, without buffer access"""
+        raise RuntimeError(f'Cannot pack for {self.__class__.__name__}')
+
+    def hash_packed(self, hasher):
+        """Calculate hash of binary representation from python value"""
+        hasher.update(self.pack())
+
     # default method implementations for the read, write and hash operations
 
 ###############################################################################
@@ -258,6 +274,11 @@ class Container(Value):
     hash_until      = until  .__func__('hash')
     update_all_but  = all_but.__func__('update')
     hash_all_but    = all_but.__func__('hash')
+    hash_packed         = all    .__func__('hash_packed')
+    hash_packed_all_but = all_but.__func__('hash_packed')
+
+    def pack(self):
+        return b''.join(v.pack() for k,v in self.kv_iterator())
 
     def read(self):
         """Safe guard for missing specializations."""
@@ -277,65 +298,275 @@ class List(Container, collections.UserList):
 
 class BList(Container, collections.UserList):
 
-    """Implements python lists"""
-    def __init__(self, method, provider, arg = list()):
-        self.data   = arg.copy()
+    """
+    Blocks of one artefact, generated lazily.
+
+    Blocks come from a generator and exist only while `process` reads,
+    compresses, signs and writes them. The list keeps the header record of
+    every written block (position, SIZE, GROUP, SEQ, CRC, CFLAG), which is all
+    the Block Index Table and the final checks need, as rows of a `Table` when
+    numpy is installed. It also keeps the prefix sums of their sizes, so the
+    size of the list and the position of any block are known without walking
+    the blocks.
+    """
+
+    TABLE = numpy is not None                                           # keep the header records in a Table
+
+    def __init__(self, method, provider, blocks, adaptive = False, precompressed = False, block_size = None):
+        self.blocks = iter(blocks)
+        self.first  = next(self.blocks, None)                           # describes the artefact, kept
+        if self.first is None:
+            raise RuntimeError('Generated list is empty')
+        self.data   = Table(type(self.first.head)) if self.TABLE else []
         self._value = self.data
+        self.ends   = array.array('Q')                                  # prefix sums of the sizes of the kept blocks
+        self._output = None
         self.method = method
+        self.adaptive = adaptive                                        # sample chunks, store the ones that won't shrink
+        self.precompressed = precompressed                              # already compressed artefact, store every chunk
+        self.skipped = 0
+        self.block_size = block_size                                    # payload limit, the DATA size of the first block if None
+        self.params = None                                              # block cache parameters, cache disabled when None
         self.provider = (provider.compressionObj() if (not self.method and provider is not None) else provider)
-        self.buff = b''
-        self.BIndex = []
-        self.uncompressedS = os.path.getsize(self[0]['DATA'].value)
+        self.chunker = Chunker(self.provider) if (not self.method and self.provider is not None) else None    # compress whole stream into blocks
+        self.uncompressedS = length(self.first['DATA'].value)
+
+    def _get_output(self):
+        return self._output
 
     def _set_output(self, output):
+        self._output = output
         super()._set_output(output)
 
-    def _set_position(self, position):
-       ''' Sets position for lis, corresponding blocks respectively '''
-       try:
-          for blk in self:
-              blk.position = position
-              position += blk.size
-       except StopIteration:
-           return None
+    def _get_size(self):
+        return self.ends[-1] if self.ends else 0
+
+    def _get_dirty(self):
+        return False                                                    # kept blocks are written
+
+    def update(self):
+        ''' Blocks are placed as process() writes them '''
+
+    def keep(self, head):
+        ''' Keep the header record of a placed block and the running size of the list '''
+        self.append(head)
+        self.ends.append(head.SIZE + (self.ends[-1] if self.ends else 0))
+
+    def offset(self, seq):
+        ''' Position of block seq, from the position of the first one '''
+        return self.position + (self.ends[seq - 1] if seq > 0 else 0)
+
+    def misplaced(self):
+        ''' Sequence numbers of the kept blocks that are not at their offset '''
+        if not self:
+            return []
+        if isinstance(self.data, Table):
+            ends = numpy.frombuffer(self.ends, numpy.uint64)
+            offsets = numpy.concatenate(([0], ends[:-1])).astype(numpy.uint64) + numpy.uint64(self.position)
+            return numpy.flatnonzero(self.data.column('position') != offsets).tolist()
+        return [seq for seq, head in enumerate(self) if head.position != self.offset(seq)]
 
     def getValue(self):
         ''' Returns artefact path'''
-        return self[0]['DATA'].value
-
-    def cleanup(self):
-        ''' Deletes empty blocks and resets sequencing for blocks'''
-        if self.BIndex != []:
-            i = 0
-            for ind in self.BIndex :
-                del self[ind - i]
-                i += 1
-            for j,blk in enumerate(self):
-                blk['SEQ'].value = j
-                blk['SEQ'].write()
+        return self.first['DATA'].value
+
+    def generate(self):
+        ''' Yields the blocks, once, writing to the output of the list '''
+        if self.blocks is None:
+            raise RuntimeError('Blocks already generated')
+        (blocks, self.blocks) = (itertools.chain((self.first,), self.blocks), None)
+        for block in blocks:
+            block.output = self._output
+            yield block
+
+    @staticmethod
+    def sign_pending(pending, signer):
+        ''' Sign loaded blocks as one batch, then write them in order '''
+        sigs = iter(signer['sign_all']([digest for blk,digest in pending if digest is not None]))
+        output = pending[0][0].output
+        end = output.tell()                                             # cached blocks may be placed and written behind them
+        for blk,digest in pending:
+            blk.signature(None if digest is None else next(sigs), True)
+            blk.dump()
+        output.seek(end)
+        pending.clear()
+
+    def skip(self, chunk):
+        ''' True when a chunk is to be stored as it is, without compressing it '''
+        if not self.method or self.provider is None:
+            return False
+        if self.precompressed or (self.adaptive and not self.provider.compressible(chunk)):
+            self.skipped += 1
+            return True
+        return False
+
+    def lookup(self, cache, block, chunk):
+        ''' Returns the cache key and the cached entry of a block, (None, None) without cache '''
+        if cache is None or self.params is None:
+            return (None, None)
+        key = cache.key(f'{self.params}/{block["SEQ"].value}', chunk)
+        return (key, cache.get(key))
+
+    def chunks(self, src, jobs = 1, cache = None):
+        ''' Yields blocks with their input chunk, the compressed chunk when known
+            beforehand (the chunk itself when skipped), and their cache key and
+            entry, in sequence order. Blocks get their final SEQ '''
+        seq = 0
+        if self.chunker is not None:
+            yield from self.cut(src, cache)
+            return
+        if not self.method or self.provider is None or jobs <= 1:
+            for block in self.generate():
+                chunk = block['DATA'].read(src)
+                block['SEQ'].value = seq
+                seq += 1
+                (key, entry) = self.lookup(cache, block, chunk)
+                yield (block, chunk, chunk if entry is None and self.skip(chunk) else None, key, entry)
+            return
+        with ThreadPoolExecutor(max_workers=jobs) as pool:              # zlib releases the GIL while compressing
+            ahead = collections.deque()
+            for block in self.generate():
+                chunk = block['DATA'].read(src)
+                block['SEQ'].value = seq
+                seq += 1
+                (key, entry) = self.lookup(cache, block, chunk)
+                if entry is not None:
+                    future = None                                       # cached, nothing to compress
+                elif self.skip(chunk):
+                    future = Future()
+                    future.set_result(chunk)
+                else:
+                    future = pool.submit(self.provider.compress_data, chunk)
+                ahead.append((block, chunk, future, key, entry))
+                if len(ahead) > 2 * jobs:                               # bounded look-ahead
+                    (blk, chunk, future, key, entry) = ahead.popleft()
+                    yield (blk, chunk, future and future.result(), key, entry)
+            while ahead:
+                (blk, chunk, future, key, entry) = ahead.popleft()
+                yield (blk, chunk, future and future.result(), key, entry)
+
+    def cut(self, src, cache = None):
+        ''' Blocks of a whole compressed artefact, as chunks() does. The artefact
+            is read by chunks of the block size and a block is only taken from
+            the generator for a payload of the chunker, so there are no empty
+            blocks, however much the artefact shrinks. The generator has to
+            keep yielding blocks if it grows. With a cache, the blocks of an
+            unchanged artefact are restored from their artefact entry without
+            compressing it; the payload stands for the chunk '''
+        size = self.block_size or self.first['DATA'].size
+        blocks = self.generate()
+        seq = 0
+        (whole, keys) = (None, [])
+        if cache is not None and self.params is not None:
+            hasher = hashlib.sha256()
+            for offset in range(0, src.size, 1 << 20):
+                hasher.update(src.read(offset, 1 << 20))
+            whole = cache.key(f'{self.params}/whole', hasher.digest())
+            cached = cache.get_keys(whole)
+            entries = [cache.get(key) for key in cached] if cached is not None else []
+            if cached is not None and all(entry is not None and cache.key(f'{self.params}/{seq}', entry[3]) == key     # keyed by the payload, intact
+                                          for seq, (key, entry) in enumerate(zip(cached, entries))):
+                for (key, entry) in zip(cached, entries):
+                    block = next(blocks)
+                    block['SEQ'].value = seq
+                    seq += 1
+                    yield (block, entry[3], None, key, entry)
+                return
+        for offset in range(0, max(src.size, 1), size):                   # an empty artefact still flushes its stream
+            for chunk in self.chunker.push(src.read(offset, size) if src.size else b'', size, offset + size >= src.size):
+                block = next(blocks)
+                block['SEQ'].value = seq
+                seq += 1
+                (key, entry) = self.lookup(cache, block, chunk)
+                keys.append(key)
+                yield (block, chunk, None, key, entry)
+        if seq == 0:                                                    # nothing even flushed, one empty block
+            block = next(blocks)
+            (key, entry) = self.lookup(cache, block, b'')
+            keys.append(key)
+            yield (block, b'', None, key, entry)
+        if whole is not None:
+            cache.put_keys(whole, keys)
 
     def process(self, kwargs, art = None):
         c_size = 0
-        for block in self:
-            block_Data = block['DATA']
-            (chunk , self.buff) = block_Data.read((self.provider if not self.method else None), self.buff, os.path.getsize(block_Data.value))   #(self.provider if not self.method else None) added because block to be
-            if (len(chunk) == 0):
-                self.BIndex.append(self.index(block))
-            else :
-                comp_chunk = block.compress(self.method, self.provider ,chunk)
-                c_size += len(comp_chunk)
-                block_Data.size = len(comp_chunk)
-                block.finalWrite(comp_chunk)
-        self.cleanup()
+        signer = kwargs['signer']
+        cache = kwargs.get('cache')
+        pending = []                                                        # loaded blocks waiting for a batch signature
+        fresh = []                                                          # signed blocks to be cached
+        with Source.acquire(self.getValue(), kwargs.get('mmap', False)) as src:     # one read handle for all blocks of the artefact
+            for (block, chunk, C_chunk, key, entry) in self.chunks(src, kwargs.get('jobs', 1), cache):
+                if entry is not None and block.restore(entry, kwargs['verifier']):
+                    cache.hit()
+                    c_size += block['DATA'].size                            # cached payload, CRC and verified signature
+                    block.dump()
+                else :
+                    if entry is not None:
+                        cache.reject(key)                                   # corrupt entry, rebuilt and stored again
+                    comp_chunk = block.compress(self.method, self.provider ,chunk, C_chunk)
+                    c_size += len(comp_chunk)
+                    if signer.get('sign_all') is None:
+                        block.stream(comp_chunk, signer['sign'])                # sign in memory, single write, checked offline (verify.py)
+                        if key is not None:
+                            cache.put(key, block['CFLAG'].value, block['CRC'].value, block['SIG'].value, comp_chunk)
+                    else:
+                        pending.append((block, block.load(comp_chunk)))
+                        if key is not None:
+                            fresh.append((key, block, comp_chunk))
+                        if len(pending) >= signer['batch']:
+                            self.sign_pending(pending, signer)
+                            self.store(cache, fresh)
+                self.keep(block.head)                                       # placed, its header is all that is kept
+        if pending:
+            self.sign_pending(pending, signer)
+            self.store(cache, fresh)
         if art != None:
             art['compressedSize'] = c_size
             art['uncompressedSize'] = self.uncompressedS
-        for block in self:
-            block.sign(kwargs['signer']['sign'])                            # sign
-            if not block.verify(kwargs['verifier']):                        # Signature verif. => not needed ?
-                raise RuntimeError(f'Signature verification failed')
         return (c_size)
 
+    @staticmethod
+    def store(cache, fresh):
+        for (key, blk, payload) in fresh:
+            cache.put(key, blk['CFLAG'].value, blk['CRC'].value, blk['SIG'].value, payload)
+        fresh.clear()
+
+###############################################################################
+
+class Chunker:
+    """
+    Cut the output of a streaming compressor into block payloads.
+
+    Every input chunk yields the payloads of the block size it completes,
+    however far the compressor's buffered output lets them pile up; the last
+    chunk flushes the compressor and also yields the rest, so no payload
+    exceeds the block size. Consumed bytes are deleted from the front of a bytearray,
+    which python does in place, so each byte is copied a constant number of
+    times whatever the compressor's lead over the blocks.
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.buff     = bytearray()
+
+    def __len__(self):
+        return len(self.buff)
+
+    def push(self, chunk, size, last = False):
+        ''' Compress chunk, return the list of block payloads it completes '''
+        self.buff += self.provider.compress(chunk)
+        if last:
+            self.buff += self.provider.flush()
+        payloads = []
+        while len(self.buff) >= size or (last and self.buff):
+            payloads.append(self.take(size))
+        return payloads
+
+    def take(self, size):
+        ret = self.buff[:size]
+        del self.buff[:size]
+        return ret
+
 ###############################################################################
 class Dict(Container, collections.UserDict):
     """Implements python dictionaries"""
@@ -394,6 +625,215 @@ class CType(Value):
             self.output.seek(self.position, io.SEEK_SET)
             self.output.write(buf)
 
+    def pack(self):
+        if self.cnt == 0:
+            return b''
+        elif self.cnt is None:
+            return struct.pack(self.fmt, self.value)
+        else:
+            return struct.pack(self.fmt, *tuple(self.value))
+
+###############################################################################
+
+class Record:
+    """
+    Fixed binary layout of named fields, packed by one precompiled struct.
+
+    The compact alternative to a `Dict` of `CType` values for headers that
+    exist once per block. Subclasses declare FIELDS as (name, struct code)
+    pairs and the matching __slots__; the struct, offsets and formats are
+    computed once per class. Field values are plain slots of the record, so a
+    record is a single small object without descriptors, and packs with a
+    single call.
+
+    Records implement the part of the `Value` interface containers use:
+    position, size, output, dirty, update, hash, pack and write. `Field`
+    gives the `CType` interface to one of their fields.
+    """
+
+    FIELDS    = ()
+    __slots__ = ('position', 'dirty', '_output')
+
+    def __init_subclass__(cls):
+        super().__init_subclass__()
+        cls.struct  = struct.Struct('!' + ''.join(code for name, code in cls.FIELDS))
+        cls.size    = cls.struct.size
+        cls.names   = tuple(name for name, code in cls.FIELDS)
+        cls.fetch   = operator.attrgetter(*cls.names)        # tuple of the field values, called with the record
+        cls.formats = {name: f'!{code}' for name, code in cls.FIELDS}
+        cls.sizes   = {name: struct.calcsize(fmt) for name, fmt in cls.formats.items()}
+        cls.offsets = {}
+        offset = 0
+        for name in cls.names:
+            cls.offsets[name] = offset
+            offset += cls.sizes[name]
+
+    def __init__(self):
+        self.position = None
+        self.dirty    = True
+        self._output  = None
+        for name in self.names:
+            setattr(self, name, 0)
+
+    @property
+    def output(self):
+        return self._output
+
+    @output.setter
+    def output(self, output):
+        if self._output != output:
+            self._output  = output
+            self.position = None
+            self.dirty    = True
+
+    def __getitem__(self, name):
+        return Field(self, name)
+
+    @property
+    def value(self):
+        return dict(zip(self.names, self.fetch(self)))
+
+    def update(self):
+        """Place the record at the file pointer if it has no position yet"""
+        if self.position is None:
+            self.position = self.output.tell()
+            self.output.seek(self.position + self.size, io.SEEK_SET)
+        self.dirty = False
+
+    def pack(self):
+        return self.struct.pack(*self.fetch(self))
+
+    def pack_but(self, name):
+        """Binary representation without one field"""
+        buf = self.pack()
+        offset = self.offsets[name]
+        return buf[:offset] + buf[offset + self.sizes[name]:]
+
+    def hash(self, hasher):
+        hasher.update(self.pack())
+
+    hash_packed = hash
+
+    def write(self):
+        self.output.seek(self.position, io.SEEK_SET)
+        self.output.write(self.pack())
+
+class Field:
+    """`CType` interface to one field of a `Record`, created on access"""
+
+    __slots__ = ('record', 'name')
+
+    def __init__(self, record, name):
+        self.record = record
+        self.name   = name
+
+    @property
+    def value(self):
+        return getattr(self.record, self.name)
+
+    @value.setter
+    def value(self, value):
+        setattr(self.record, self.name, value)
+        self.record.dirty = True
+
+    @property
+    def fmt(self):
+        return self.record.formats[self.name]
+
+    @property
+    def size(self):
+        return self.record.sizes[self.name]
+
+    @property
+    def position(self):
+        if self.record.position is None:
+            return None
+        return self.record.position + self.record.offsets[self.name]
+
+    def update(self):
+        """Placed with its record"""
+
+    def pack(self):
+        return struct.pack(self.fmt, self.value)
+
+    def write(self):
+        self.record.output.seek(self.position, io.SEEK_SET)
+        self.record.output.write(self.pack())
+
+###############################################################################
+
+class Table:
+    """
+    Records of one `Record` class as the rows of a NumPy structured array.
+
+    The dtype has the big endian fields of the record struct at the same
+    offsets, so a row is the packed record and `tobytes` of the table is the
+    records packed one after the other. Positions are kept in a column of
+    their own. A row takes the size of the packed record plus 8 bytes, where a
+    record object takes about 200. Indexing gives back a record, detached from
+    any output, and `column` gives a field of all rows for vectorised sums and
+    comparisons. Needs numpy.
+    """
+
+    DTYPES = {'B': 'u1', 'H': 'u2', 'L': 'u4', 'I': 'u4', 'Q': 'u8',
+              'b': 'i1', 'h': 'i2', 'l': 'i4', 'i': 'i4', 'q': 'i8'}
+
+    def __init__(self, record, capacity = 1024):
+        self.record    = record
+        self.dtype     = numpy.dtype({'names':   list(record.names),
+                                      'formats': ['>' + self.DTYPES[record.formats[name][1:]] for name in record.names],
+                                      'offsets': [record.offsets[name] for name in record.names],
+                                      'itemsize': record.size})
+        self.rows      = numpy.zeros(capacity, self.dtype)
+        self.positions = numpy.zeros(capacity, numpy.uint64)
+        self.count     = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, rec):
+        if self.count == len(self.rows):
+            self.grow(2 * self.count)
+        self.rows[self.count]      = rec.fetch(rec)
+        self.positions[self.count] = rec.position
+        self.count += 1
+
+    def grow(self, capacity):
+        ''' Reallocate, numpy.resize would not keep the byte order of the fields '''
+        (rows, positions) = (self.rows, self.positions)
+        self.rows      = numpy.zeros(capacity, self.dtype)
+        self.positions = numpy.zeros(capacity, numpy.uint64)
+        self.rows[:self.count]      = rows[:self.count]
+        self.positions[:self.count] = positions[:self.count]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            raise TypeError('Table does not slice, use column()')
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('Table index out of range')
+        rec = self.record()
+        for name, value in zip(self.record.names, self.rows[index].item()):
+            setattr(rec, name, value)
+        rec.position = int(self.positions[index])
+        rec.dirty    = False
+        return rec
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def column(self, name):
+        ''' Field of all rows, 'position' for the positions '''
+        if name == 'position':
+            return self.positions[:self.count]
+        return self.rows[name][:self.count]
+
+    def tobytes(self):
+        ''' All records packed, in order '''
+        return self.rows[:self.count].tobytes()
+
 ###############################################################################
 
 class ByteArray(Value):
@@ -409,47 +849,213 @@ class ByteArray(Value):
     def write(self):
         self.output.seek(self.position, io.SEEK_SET)
         self.output.write(self.value)
-        
+
+    def pack(self):
+        return self.value
+
 ###############################################################################
 
 class File(Value):
     """Implements a file"""
 
     offset = Dirty()
+    chunk  = Access()   # in memory payload of a block being streamed
 
     def _get_size(self):
         if self._size is not None:
             return self._size
         else:
-            return os.path.getsize(self.value)
+            return length(self.value)
     
     def write(self, chunk):
         self.output.seek(self.position, io.SEEK_SET)
         self.output.write(chunk)
 
-    def read(self, provider = None, buff = None, size = None):
-        with open(self.value, 'rb') as src:                                               #open input file for b read
-            if self.offset is not None:
-                src.seek(self.offset, io.SEEK_SET)                                        #block_Data.offset refers to offset in input file
-                chunk = src.read(self.size)
-                if len(chunk)== 0:
-                    print(src, chunk, self.size, self.offset)
-                    raise EOFError('unexpected EOF')
-                if provider is None :
-                    return (chunk, b'')
-                else :                    
-                    buff = buff + provider.compress(chunk)
-                    if src.tell() == size:
-                        rest = provider.flush()
-                        buff += rest
-                        return (buff, buff)
-                    if len(buff) > self.size:
-                        ret = buff[:self.size]
-                        buff = buff[self.size:]
-                        return (ret, buff)                                                  # block.size dATA                                          # flush 
-                    else :
-                        buff = buff
-                        return (b'',buff)                                                  # nothing
-            else:
-                raise RuntimeError(f'Data block offset is None')
+    def pack(self):
+        if self.chunk is None:
+            raise RuntimeError('No chunk to pack')
+        return self.chunk
+
+    def read(self, source = None):
+        if self.offset is None:
+            raise RuntimeError(f'Data block offset is None')
+        if source is None:
+            with Source.acquire(self.value) as src:                                       #open input file for b read
+                return self.read(src)
+        chunk = source.read(self.offset, self.size)                                       #block_Data.offset refers to offset in input file
+        if len(chunk)== 0:
+            raise EOFError(f'unexpected EOF in {self.value} at {self.offset}')
+        return chunk
+
+###############################################################################
+
+class Source:
+    """
+    Shared read handle of an input file.
+
+    Handles are reference counted per path: `acquire` opens the file once and
+    hands out the same handle until every user called `release`. Blocks read
+    in order are read sequentially from the buffered reader, without seeking.
+
+    A mapped source `mmap`s the file instead and returns `memoryview` slices,
+    so blocks reach the hasher, the compressor and the output without a copy.
+    Pages more than `KEEP` bytes behind the last read are dropped from the
+    process, so resident memory does not grow with the file size.
+    """
+
+    handles = {}
+    KEEP    = 1 << 23
+
+    def __init__(self, path, mapped = False):
+        self.path = path
+        self.refs = 0
+        self.file = open(path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.map  = None
+        if mapped and self.size > 0:                                        # empty files cannot be mapped
+            self.map  = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.map)
+            self.dropped = 0
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                self.map.madvise(mmap.MADV_SEQUENTIAL)
+
+    @classmethod
+    def acquire(cls, path, mapped = False):
+        if isinstance(path, (bytes, bytearray)):
+            return Buffer(path)
+        key = (os.path.abspath(path), mapped)
+        src = cls.handles.get(key)
+        if src is None:
+            src = cls.handles[key] = cls(path, mapped)
+            src.key = key
+        src.refs += 1
+        return src
+
+    def release(self):
+        self.refs -= 1
+        if self.refs == 0:
+            del Source.handles[self.key]
+            self.close()
+
+    def close(self):
+        if self.map is not None:
+            self.view.release()
+            try:
+                self.map.close()
+            except BufferError:
+                pass                                                        # slices still in use, unmapped once they are gone
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def read(self, offset, size):
+        if self.map is not None:
+            self.drop(offset)
+            return self.view[offset:offset + size]
+        if self.file.tell() != offset:
+            self.file.seek(offset, io.SEEK_SET)
+        return self.file.read(size)
+
+    def drop(self, offset):
+        ''' Release mapped pages far behind offset, they are read again from the page cache if needed '''
+        end = (offset - self.KEEP) // mmap.PAGESIZE * mmap.PAGESIZE
+        if end > self.dropped and hasattr(mmap, 'MADV_DONTNEED'):
+            self.map.madvise(mmap.MADV_DONTNEED, self.dropped, end - self.dropped)
+            self.dropped = end
+
+class Buffer(Source):
+    """In memory input, a payload generated in process instead of a file"""
+
+    def __init__(self, data):
+        self.data = data
+        self.size = len(data)
+
+    def release(self):
+        pass
+
+    def read(self, offset, size):
+        return self.data[offset:offset + size]
+
+class Output:
+    """
+    Output file coalescing writes.
+
+    Values are placed by moving the file pointer past them and written later,
+    once signed, so a buffered file is flushed by a seek for every block.
+    Here seeking only moves the pointer. Writes continuing the pending ones
+    are collected in memory and written at once when SIZE bytes are pending,
+    when another position is written or when the file is read.
+    """
+
+    SIZE = 1 << 20
+
+    def __init__(self, path, mode = 'w+b'):
+        self.file  = open(path, mode, buffering=0)
+        self.pos   = 0
+        self.start = 0                                                      # position of the pending bytes
+        self.buff  = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence = io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.pos = offset
+        elif whence == io.SEEK_CUR:
+            self.pos += offset
+        else:
+            self.flush()
+            self.pos = self.file.seek(offset, whence)
+        return self.pos
+
+    def write(self, data):
+        if self.pos != self.start + len(self.buff):
+            self.flush()
+        self.buff += data
+        self.pos += len(data)
+        if len(self.buff) >= self.SIZE:
+            self.flush()
+        return len(data)
+
+    def writelines(self, lines):
+        for data in lines:
+            self.write(data)
+
+    def read(self, size = -1):
+        self.flush()
+        self.file.seek(self.pos, io.SEEK_SET)
+        data = self.file.read(size)
+        self.pos += len(data)
+        return data
+
+    def flush(self):
+        if self.buff:
+            self.file.seek(self.start, io.SEEK_SET)
+            with memoryview(self.buff) as view:
+                done = 0
+                while done < len(view):                                     # raw writes may be partial
+                    done += self.file.write(view[done:])
+            self.buff.clear()
+        self.start = self.pos
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+def length(value):
+    ''' Size of a File value, a path or an in memory payload '''
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return os.path.getsize(value)
+
 ###############################################################################
@@ -7,9 +7,11 @@ Usage:
 Options:
 
     -i <Input file Ex -i test.tar >
-    -a <Compression algorithm defaults to None Ex -a zlib>
+    -a <Compression algorithm defaults to None Ex -a zlib
+            Supported algorithm  : zlib, xz, bz2, zstd (if installed), lz4 (if installed)>
     -o <Output path Ex -o testOutput/>
     -c <Flag to specify compress else decompress>
+    -p <Compression profile fast, balanced or max, defaults to the library default>
 
 Example:
     de_compress.py -i test -a zlib -o output/ -c
@@ -23,85 +25,247 @@ import argparse
 import os
 import sys
 
+try:
+    import lzma
+except ImportError:                                 # python built without liblzma
+    lzma = None
+try:
+    import bz2
+except ImportError:                                 # python built without libbz2
+    bz2 = None
+try:
+    import zstandard
+except ImportError:                                 # optional, pip install zstandard
+    zstandard = None
+try:
+    import lz4.frame as lz4frame
+except ImportError:                                 # optional, pip install lz4
+    lz4frame = None
+
+
+###############################################################################
+# Compression backends
+#   Each backend compresses whole buffers and provides streaming objects with
+#   the zlib interface: compressobj() with compress(data) / flush() and
+#   decompressobj() with decompress(data). Backends are registered by name.
+#
+#   Tuning settings are handed to every call as keyword arguments. OPTIONS
+#   lists the settings a backend accepts, PROFILES the presets of the
+#   --compress-profile option; 'balanced' is the library default.
+
+BACKENDS = {}
+PROFILES = ('fast', 'balanced', 'max')
+
+def register(name, extension):
+    def decorator(cls):
+        cls.name      = name
+        cls.extension = extension
+        BACKENDS[name] = cls()
+        return cls
+    return decorator
+
+class Backend:
+    OPTIONS  = ()
+    PROFILES = {}
+
+    def configure(self, profile = None, **settings):
+        '''Settings of a profile, overridden by explicit settings'''
+        if profile is not None and profile not in PROFILES:
+            raise ValueError('Unknown compression profile : ' + profile)
+        result = dict(self.PROFILES.get(profile, {}))
+        for key, value in settings.items():
+            if key not in self.OPTIONS:
+                raise ValueError(f'Unsupported compression setting for {self.name} : {key}')
+            result[key] = value
+        return result
+
+@register('None', '')
+class NoneBackend(Backend):
+    def compress(self, data):
+        return data
+    def decompress(self, data):
+        return data
+    def compressobj(self):
+        return None
+    def decompressobj(self):
+        return None
+
+@register('zlib', '.zlib')
+class ZlibBackend(Backend):
+    OPTIONS  = ('level', 'wbits', 'memLevel', 'strategy')
+    PROFILES = {
+        'fast':     {'level': 1},
+        'balanced': {},
+        'max':      {'level': 9, 'memLevel': 9}
+    }
+
+    def configure(self, profile = None, **settings):
+        result = super().configure(profile, **settings)
+        if isinstance(result.get('strategy'), str):             # e.g. 'Z_RLE' from the config file
+            result['strategy'] = getattr(zlib, result['strategy'])
+        if not 9 <= result.get('wbits', zlib.MAX_WBITS) <= 15:  # zlib container only, no raw deflate or gzip
+            raise ValueError('zlib wbits must be in range 9-15')
+        return result
+
+    def compress(self, data, level = zlib.Z_DEFAULT_COMPRESSION, wbits = zlib.MAX_WBITS,
+                 memLevel = zlib.DEF_MEM_LEVEL, strategy = zlib.Z_DEFAULT_STRATEGY):
+        if memLevel == zlib.DEF_MEM_LEVEL and strategy == zlib.Z_DEFAULT_STRATEGY:
+            return zlib.compress(data, level, wbits)
+        obj = self.compressobj(level, wbits, memLevel, strategy)
+        return obj.compress(data) + obj.flush()
+    def decompress(self, data):
+        return zlib.decompress(data)
+    def compressobj(self, level = zlib.Z_DEFAULT_COMPRESSION, wbits = zlib.MAX_WBITS,
+                    memLevel = zlib.DEF_MEM_LEVEL, strategy = zlib.Z_DEFAULT_STRATEGY):
+        return zlib.compressobj(level, zlib.DEFLATED, wbits, memLevel, strategy)
+    def decompressobj(self):
+        return zlib.decompressobj()
+
+if lzma is not None:
+    @register('xz', '.xz')
+    class XzBackend(Backend):
+        OPTIONS  = ('level',)
+        PROFILES = {
+            'fast':     {'level': 0},
+            'balanced': {},
+            'max':      {'level': 9 | lzma.PRESET_EXTREME}
+        }
+        def compress(self, data, level = None):
+            return lzma.compress(data, format=lzma.FORMAT_XZ, preset=level)
+        def decompress(self, data):
+            return lzma.decompress(data, format=lzma.FORMAT_XZ)
+        def compressobj(self, level = None):
+            return lzma.LZMACompressor(format=lzma.FORMAT_XZ, preset=level)
+        def decompressobj(self):
+            return lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+
+if bz2 is not None:
+    @register('bz2', '.bz2')
+    class Bz2Backend(Backend):
+        OPTIONS  = ('level',)
+        PROFILES = {
+            'fast':     {'level': 1},
+            'balanced': {},
+            'max':      {'level': 9}
+        }
+        def compress(self, data, level = 9):
+            return bz2.compress(data, level)
+        def decompress(self, data):
+            return bz2.decompress(data)
+        def compressobj(self, level = 9):
+            return bz2.BZ2Compressor(level)
+        def decompressobj(self):
+            return bz2.BZ2Decompressor()
+
+if zstandard is not None:
+    @register('zstd', '.zst')
+    class ZstdBackend(Backend):
+        OPTIONS  = ('level',)
+        PROFILES = {
+            'fast':     {'level': 1},
+            'balanced': {},
+            'max':      {'level': 19}
+        }
+        def compress(self, data, level = 3):
+            return zstandard.ZstdCompressor(level=level).compress(data)
+        def decompress(self, data):
+            return zstandard.ZstdDecompressor().decompress(data)
+        def compressobj(self, level = 3):
+            return zstandard.ZstdCompressor(level=level).compressobj()
+        def decompressobj(self):
+            return zstandard.ZstdDecompressor().decompressobj()
+
+if lz4frame is not None:
+    class Lz4Stream:
+        '''LZ4 frame compressor with the zlib compress / flush interface'''
+        def __init__(self, level):
+            self.obj    = lz4frame.LZ4FrameCompressor(compression_level=level)
+            self.header = self.obj.begin()
+        def compress(self, data):
+            out, self.header = self.header + self.obj.compress(data), b''
+            return out
+        def flush(self):
+            out, self.header = self.header + self.obj.flush(), b''
+            return out
+
+    @register('lz4', '.lz4')
+    class Lz4Backend(Backend):
+        OPTIONS  = ('level',)
+        PROFILES = {
+            'fast':     {},                                 # the default is already the fast mode
+            'balanced': {},
+            'max':      {'level': lz4frame.COMPRESSIONLEVEL_MAX}
+        }
+        def compress(self, data, level = 0):
+            return lz4frame.compress(data, compression_level=level)
+        def decompress(self, data):
+            return lz4frame.decompress(data)
+        def compressobj(self, level = 0):
+            return Lz4Stream(level)
+        def decompressobj(self):
+            return lz4frame.LZ4FrameDecompressor()
+
+###############################################################################
+# Adaptive compression
+#   Data is only worth compressing when a fast trial compression of a prefix
+#   shrinks it noticeably; compressed archives or media would just cost time.
+
+SAMPLE_SIZE  = 4096
+SAMPLE_RATIO = 0.97
+
+def compressible(data, sample = SAMPLE_SIZE, ratio = SAMPLE_RATIO):
+    prefix = data[:sample]
+    return len(zlib.compress(prefix, 1)) < len(prefix) * ratio
+
+###############################################################################
 
 class Compress:
-    def __init__(self, algorithm):
+    def __init__(self, algorithm, profile = None, **settings):
+        if algorithm not in BACKENDS:
+            raise NotImplementedError('Unsuported algorithm :' + algorithm)
         self.algorithm = algorithm
+        self.backend   = BACKENDS[algorithm]
+        self.settings  = self.backend.configure(profile, **settings)
         
     def compress_data(self, i_Data):
-        if self.algorithm == 'zlib':
-            return zlib.compress(i_Data)
-        elif self.algorithm == 'None':
-            #No compression algorithm specified
-            return i_Data
-        else :
-            raise NotImplementedError('Unsuported algorithm :' + self.algorithm)
-        #elif self.agorith =='zip'
+        return self.backend.compress(i_Data, **self.settings)
         
     def decompress_data(self, i_Data):
-        if self.algorithm == 'zlib':
-            return zlib.decompress(i_Data)
-        elif self.algorithm == 'None':
-            #No compression algorithm specified
-            return i_Data
-        else:
-            raise NotImplementedError('Unsuported algorithm :' + self.algorithm)
+        return self.backend.decompress(i_Data)
+
+    def compressible(self, i_Data):
+        return self.algorithm != 'None' and compressible(i_Data)
 
     def compress_file(self, Data, Output_file_path):
-        if self.algorithm == 'zlib':
-            compressed_contents = zlib.compress(Data)
-            with open(Output_file_path + '/compressed.zlib', 'wb') as compressed_file:
+        if self.algorithm != 'None':
+            compressed_contents = self.compress_data(Data)
+            with open(Output_file_path + '/compressed' + self.backend.extension, 'wb') as compressed_file:
                 compressed_file.write(compressed_contents)
-        elif self.algorithm == 'None':
-            #No compression algorithm specified
-            pass
-        else:
-            raise NotImplementedError('Unsuported algorithm :' + self.algorithm)
 
     def decompress_file(self, Data, Output_file_path):
-        if self.algorithm == 'zlib':
-            decompressed_contents = zlib.decompress(Data)
+        if self.algorithm != 'None':
+            decompressed_contents = self.decompress_data(Data)
             with open(Output_file_path + '/decompressed', 'wb') as decompressed_file:
                 decompressed_file.write(decompressed_contents)
-        elif self.algorithm == 'None':
-            #No compression algorithm specified
-            pass
-        else:
-            raise NotImplementedError('Unsuported algorithm : ' + self.algorithm)
         
     def compressionObj(self):
-        if self.algorithm == 'zlib':
-            return zlib.compressobj(method=zlib.DEFLATED)
-        elif self.algorithm == 'None':
-            #No compression algorithm specified
-            return None
-        else:
-            raise NotImplementedError('Unsuported algorithm : ' + self.algorithm)
+        return self.backend.compressobj(**self.settings)
         
     def decompressionObj(self):
-        if self.algorithm == 'zlib':
-            return zlib.decompressobj()
-        elif self.algorithm == 'None':
-            #No compression algorithm specified
-            return None
-        else:
-            raise NotImplementedError('Unsuported algorithm : ' + self.algorithm)   
-
-#Dictionary of SAlgos
-SAlgos = {
-    'zlib' : '.zlib',
-    'None' : ''
-#    'gzip' : '.zip'     gzip not implemented but as example
-}
+        return self.backend.decompressobj()
+
+#Dictionary of SAlgos, algorithm name to file extension
+SAlgos = {name: backend.extension for name, backend in BACKENDS.items()}
 
 if __name__ == "__main__":
     try:
         # Set up command-line arguments
-        parser = argparse.ArgumentParser(description='tool to compress a file using zlib')
+        parser = argparse.ArgumentParser(description='tool to compress a file using zlib, xz, bz2, zstd or lz4')
         parser.add_argument('-i','--input_file_path', help='Input path to the file to compress')                    #relative input file path
-        parser.add_argument('-a','--algorithm', help='Specify compression algorithm',default='None')                #either zlib(gzip) or none ftm
+        parser.add_argument('-a','--algorithm', help='Specify compression algorithm',default='None')                #any registered backend, see SAlgos
         parser.add_argument('-o','--output_file_path', help='Output file path',default='')
         parser.add_argument('-c', '--compress', action='store_true')                                                # compression on/off flag
+        parser.add_argument('-p', '--profile', choices=PROFILES, help='Compression profile')
 
         # Parse arguments
         args = parser.parse_args()
@@ -110,7 +274,7 @@ if __name__ == "__main__":
         
         #instanciate object
         if args.algorithm in SAlgos:
-            pop=Compress(args.algorithm)
+            pop=Compress(args.algorithm, args.profile)
         else :
             raise NotImplementedError('Unsuported algorithm : ' + args.algorithm)
 
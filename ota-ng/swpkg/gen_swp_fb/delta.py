@@ -0,0 +1,137 @@
+'''Binary delta of an artefact against its previous version
+
+Usage:
+
+    delta.py diff <old> <new> <delta>
+    delta.py patch <old> <delta> <new>
+
+Format (big endian):
+
+    header  'SWPD', version H, old size Q, old SHA-256, new size Q
+    COPY    op B = 1, old offset Q, length Q
+    ADD     op B = 2, length Q, followed by length bytes
+
+Applying the operations in order to the old artefact gives the new one.
+Matching is done on probes of BLOCK bytes of the new artefact. A probe is
+searched after, then before the end of the previous match, so shifted
+content is found, else looked up in an index of the old artefact's aligned
+blocks. Matches are then extended in both directions.
+
+Memory: read() maps the artefacts, so the old and the new one are paged in
+from their files as the matching goes, not loaded. The delta itself is
+built in memory, up to the size of the new artefact plus the operation
+headers, and the index of the old artefact takes about 100 bytes per
+BLOCK of it, 40 MB for a 100 MB artefact.
+'''
+
+import os
+import sys
+import mmap
+import struct
+import hashlib
+
+
+MAGIC   = b'SWPD'
+VERSION = 1
+HEADER  = struct.Struct('>4sHQ32sQ')
+COPY    = struct.Struct('>BQQ')
+ADD     = struct.Struct('>BQ')
+BLOCK   = 256                       # probe and index granularity
+WINDOW  = 1 << 16                   # search range around the expected offset
+
+###############################################################################
+
+def match_length(old, new, o, n, limit):
+    ''' Length of the common prefix of old[o:] and new[n:], at most limit '''
+    length = 0
+    step = 4096
+    while step > 0:
+        while length + step <= limit and old[o + length:o + length + step] == new[n + length:n + length + step]:
+            length += step
+        step //= 2
+    return length
+
+def diff(old, new):
+    ''' Returns (delta, copied bytes) to rebuild new from old, both bytes '''
+    (view, new) = (memoryview(old), memoryview(new))
+    index = {}
+    for off in range(0, len(old) - BLOCK + 1, BLOCK):
+        index.setdefault(hash(view[off:off + BLOCK].tobytes()), off)
+    ops = [HEADER.pack(MAGIC, VERSION, len(old), hashlib.sha256(old).digest(), len(new))]
+    copied = 0
+    literal = 0                                                         # start of pending ADD data
+    expected = 0                                                        # old offset following the last match
+    pos = 0
+    while pos + BLOCK <= len(new):
+        probe = new[pos:pos + BLOCK].tobytes()
+        off = old.find(probe, expected, expected + WINDOW + BLOCK)      # content usually stays in order
+        if off < 0:
+            off = old.find(probe, max(0, expected - WINDOW), expected + BLOCK)
+        if off < 0:
+            off = index.get(hash(probe), -1)
+            if off >= 0 and view[off:off + BLOCK] != probe:
+                off = -1
+        if off < 0:
+            pos += BLOCK
+            continue
+        back = 0                                                        # extend backwards into pending ADD data
+        while pos - back > literal and off - back > 0 and old[off - back - 1] == new[pos - back - 1]:
+            back += 1
+        (pos, off) = (pos - back, off - back)
+        length = match_length(view, new, off, pos, min(len(old) - off, len(new) - pos))
+        if pos > literal:
+            ops += (ADD.pack(2, pos - literal), new[literal:pos])
+        ops.append(COPY.pack(1, off, length))
+        copied += length
+        pos += length
+        literal = pos
+        expected = off + length
+    if len(new) > literal:
+        ops += (ADD.pack(2, len(new) - literal), new[literal:])
+    return (b''.join(ops), copied)
+
+def patch(old, delta):
+    ''' Returns the new artefact from old and delta '''
+    (magic, version, old_size, old_hash, new_size) = HEADER.unpack_from(delta)
+    if magic != MAGIC or version != VERSION:
+        raise RuntimeError('Not a delta')
+    if old_size != len(old) or old_hash != hashlib.sha256(old).digest():
+        raise RuntimeError('Delta does not apply to this artefact')
+    out = bytearray()
+    pos = HEADER.size
+    while pos < len(delta):
+        if delta[pos] == 1:
+            (_, off, length) = COPY.unpack_from(delta, pos)
+            out += old[off:off + length]
+            pos += COPY.size
+        elif delta[pos] == 2:
+            (_, length) = ADD.unpack_from(delta, pos)
+            pos += ADD.size
+            out += delta[pos:pos + length]
+            pos += length
+        else:
+            raise RuntimeError(f'Unknown delta operation {delta[pos]}')
+    if len(out) != new_size:
+        raise RuntimeError('Delta output size mismatch')
+    return bytes(out)
+
+def read(path):
+    ''' Read only map of an artefact, bytes if it is empty '''
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+###############################################################################
+
+if __name__ == "__main__":
+    if len(sys.argv) != 5 or sys.argv[1] not in ('diff', 'patch'):
+        print(__doc__)
+        sys.exit(1)
+    if sys.argv[1] == 'diff':
+        (data, copied) = diff(read(sys.argv[2]), read(sys.argv[3]))
+        print(f'delta {len(data)} bytes, {copied} bytes copied')
+    else:
+        data = patch(read(sys.argv[2]), read(sys.argv[3]))
+    with open(sys.argv[4], 'wb') as f:
+        f.write(data)
@@ -0,0 +1,435 @@
+'''FlatBuffers manifest encoder
+
+Builds the binary FlatBuffer of a JSON manifest in process, as
+`flatc -b <schema> <json>` would, from the .fbs schema and the flatbuffers
+Python runtime. Supported schema subset: include, namespace, attribute,
+enum (bit_flags), union, struct, table (id, deprecated), root_type and
+file_identifier.
+
+Usage:
+
+    flatbuf.py <schema.fbs> <manifest.json> [<output.bin>]
+'''
+
+import os
+import re
+import sys
+import json
+import flatbuffers
+from flatbuffers import number_types as N
+
+
+###############################################################################
+# Scalar types: name -> (flags, size)
+
+SCALARS = {
+    'bool'   : (N.BoolFlags,    1),
+    'byte'   : (N.Int8Flags,    1), 'int8'   : (N.Int8Flags,    1),
+    'ubyte'  : (N.Uint8Flags,   1), 'uint8'  : (N.Uint8Flags,   1),
+    'short'  : (N.Int16Flags,   2), 'int16'  : (N.Int16Flags,   2),
+    'ushort' : (N.Uint16Flags,  2), 'uint16' : (N.Uint16Flags,  2),
+    'int'    : (N.Int32Flags,   4), 'int32'  : (N.Int32Flags,   4),
+    'uint'   : (N.Uint32Flags,  4), 'uint32' : (N.Uint32Flags,  4),
+    'long'   : (N.Int64Flags,   8), 'int64'  : (N.Int64Flags,   8),
+    'ulong'  : (N.Uint64Flags,  8), 'uint64' : (N.Uint64Flags,  8),
+    'float'  : (N.Float32Flags, 4), 'float32': (N.Float32Flags, 4),
+    'double' : (N.Float64Flags, 8), 'float64': (N.Float64Flags, 8),
+}
+
+TOKENS = re.compile(r'''
+      (?P<space>\s+|//[^\n]*|/\*.*?\*/)
+    | (?P<string>"(?:[^"\\]|\\.)*")
+    | (?P<number>[-+]?(?:0[xX][0-9a-fA-F]+|\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?))
+    | (?P<ident>[A-Za-z_][A-Za-z0-9_.]*)
+    | (?P<punct>[{}\[\]();:,=])
+''', re.VERBOSE | re.DOTALL)
+
+###############################################################################
+
+class Enum:
+    def __init__(self, name, base, values, flags = False, union = False):
+        self.name   = name
+        self.base   = base                                          # underlying scalar type
+        self.values = values                                        # member name -> value
+        self.flags  = flags
+        self.union  = union
+
+    def value(self, val):
+        if isinstance(val, bool) or not isinstance(val, (int, str)):
+            raise RuntimeError(f'{self.name}: invalid value {val!r}')
+        if isinstance(val, int):
+            return val
+        if re.fullmatch(r'[-+]?(0[xX][0-9a-fA-F]+|\d+)', val):          # schema defaults are tokens
+            return int(val, 0)
+        members = val.split() if self.flags else [val]
+        for m in members:
+            if m not in self.values:
+                raise RuntimeError(f'{self.name}: unknown value {m!r}')
+        return sum(self.values[m] for m in members)
+
+class Field:
+    def __init__(self, name, ftype, default, attrs):
+        self.name    = name
+        self.type    = ftype                                        # type name or ('vector', type name)
+        self.default = default
+        self.attrs   = attrs
+        self.slot    = None
+
+class Compound:
+    def __init__(self, name, struct):
+        self.name   = name
+        self.struct = struct
+        self.fields = []
+        self.size   = 0                                             # structs only
+        self.align  = 1
+
+###############################################################################
+
+class Schema:
+    """
+    Parsed .fbs schema, encodes JSON values of its root type to FlatBuffers.
+
+    Schemas are cached per path by `load`, so a process encoding many
+    manifests parses each schema once.
+    """
+
+    _schemas = {}
+
+    @classmethod
+    def load(cls, path):
+        path = os.path.abspath(path)
+        if path not in cls._schemas:
+            cls._schemas[path] = cls(path)
+        return cls._schemas[path]
+
+    def __init__(self, path):
+        self.types      = {}
+        self.root       = None
+        self.identifier = None
+        self.parse(path, set())
+        if self.root is None:
+            raise RuntimeError(f'{path}: no root_type')
+        for t in self.types.values():
+            if isinstance(t, Compound):
+                self.layout(t)
+
+    ###########################################################################
+    # parsing
+
+    def parse(self, path, seen):
+        path = os.path.abspath(path)
+        if path in seen:
+            return
+        seen.add(path)
+        with open(path, 'r') as f:
+            text = f.read()
+        toks = []
+        pos = 0
+        while pos < len(text):
+            m = TOKENS.match(text, pos)
+            if m is None:
+                raise RuntimeError(f'{path}: unexpected {text[pos:pos + 20]!r}')
+            pos = m.end()
+            if m.lastgroup != 'space':
+                toks.append(m.group())
+        self.toks = toks
+        self.pos  = 0
+        self.ns   = ''
+        while self.pos < len(self.toks):
+            kw = self.next()
+            if kw == 'include':
+                name = self.string()
+                (toks, at, ns) = (self.toks, self.pos, self.ns)
+                self.parse(os.path.join(os.path.dirname(path), name), seen)
+                (self.toks, self.pos, self.ns) = (toks, at, ns)
+                self.expect(';')
+            elif kw == 'namespace':
+                self.ns = self.next()
+                self.expect(';')
+            elif kw in ('attribute', 'file_extension'):
+                self.next()
+                self.expect(';')
+            elif kw == 'file_identifier':
+                self.identifier = self.string().encode()
+                if len(self.identifier) != 4:
+                    raise RuntimeError('file_identifier must be 4 characters')
+                self.expect(';')
+            elif kw == 'root_type':
+                self.root = (self.next(), self.ns)
+                self.expect(';')
+            elif kw == 'enum':
+                self.parse_enum(False)
+            elif kw == 'union':
+                self.parse_enum(True)
+            elif kw in ('table', 'struct'):
+                self.parse_compound(kw == 'struct')
+            else:
+                raise NotImplementedError(f'{path}: {kw}')
+
+    def next(self):
+        if self.pos >= len(self.toks):
+            raise RuntimeError('unexpected end of schema')
+        self.pos += 1
+        return self.toks[self.pos - 1]
+
+    def peek(self):
+        return self.toks[self.pos] if self.pos < len(self.toks) else None
+
+    def expect(self, tok):
+        got = self.next()
+        if got != tok:
+            raise RuntimeError(f'expected {tok!r}, got {got!r}')
+
+    def string(self):
+        return json.loads(self.next())
+
+    def qualified(self, name):
+        return f'{self.ns}.{name}' if self.ns else name
+
+    def attributes(self):
+        attrs = {}
+        if self.peek() == '(':
+            self.next()
+            while self.peek() != ')':
+                key = self.next()
+                attrs[key] = None
+                if self.peek() == ':':
+                    self.next()
+                    val = self.next()
+                    attrs[key] = json.loads(val) if val.startswith('"') else val
+                if self.peek() == ',':
+                    self.next()
+            self.next()
+        return attrs
+
+    def parse_enum(self, union):
+        name = self.qualified(self.next())
+        base = 'ubyte'
+        if self.peek() == ':':
+            self.next()
+            base = self.next()
+        attrs  = self.attributes()
+        flags  = 'bit_flags' in attrs
+        values = {'NONE': 0} if union else {}
+        nxt    = len(values)
+        self.expect('{')
+        while self.peek() != '}':
+            member = self.next()
+            if self.peek() == '=':
+                self.next()
+                nxt = int(self.next(), 0)
+            values[member] = (1 << nxt) if flags else nxt
+            nxt += 1
+            if self.peek() == ',':
+                self.next()
+        self.next()
+        self.types[name] = Enum(name, base, values, flags, union)
+
+    def parse_compound(self, struct):
+        obj = Compound(self.qualified(self.next()), struct)
+        self.attributes()
+        self.expect('{')
+        while self.peek() != '}':
+            fname = self.next()
+            self.expect(':')
+            if self.peek() == '[':
+                self.next()
+                ftype = ('vector', self.next())
+                if self.peek() == ':':                              # fixed length arrays
+                    raise NotImplementedError(f'{obj.name}.{fname}: arrays')
+                self.expect(']')
+            else:
+                ftype = self.next()
+            default = None
+            if self.peek() == '=':
+                self.next()
+                default = self.next()
+            obj.fields.append(Field(fname, ftype, default, self.attributes()))
+            self.expect(';')
+        self.next()
+        self.types[obj.name] = obj
+
+    ###########################################################################
+    # type resolution
+
+    def resolve(self, name, ns = ''):
+        ''' Resolves a type name against the namespace it was used in '''
+        if name in SCALARS or name == 'string':
+            return name
+        parts = ns.split('.') if ns else []
+        for i in range(len(parts), -1, -1):
+            full = '.'.join(parts[:i] + [name])
+            if full in self.types:
+                return self.types[full]
+        raise RuntimeError(f'unknown type {name}')
+
+    def declares(self, *path):
+        ''' True if the root type has the field at path, e.g. declares('Artefact', 'name') '''
+        t = self.resolve(*self.root)
+        for name in path:
+            f = next((f for f in getattr(t, 'fields', ()) if f.name == name), None)
+            if f is None:
+                return False
+            t = self.field_type(f, t.name.rpartition('.')[0])
+        return True
+
+    def layout(self, obj):
+        ''' Assigns vtable slots of tables and offsets of struct fields '''
+        if obj.struct:
+            if obj.size:
+                return
+            for f in obj.fields:
+                t = self.resolve(f.type, obj.name.rpartition('.')[0]) if not isinstance(f.type, tuple) else None
+                if isinstance(t, Compound) and t.struct:
+                    self.layout(t)
+                    (size, align) = (t.size, t.align)
+                elif isinstance(t, Enum):
+                    size = align = SCALARS[t.base][1]
+                elif t in SCALARS:
+                    size = align = SCALARS[t][1]
+                else:
+                    raise RuntimeError(f'{obj.name}.{f.name}: not allowed in a struct')
+                f.offset = (obj.size + align - 1) // align * align
+                f.size   = size
+                obj.size = f.offset + size
+                obj.align = max(obj.align, align)
+            obj.size = (obj.size + obj.align - 1) // obj.align * obj.align
+            return
+        slot = 0
+        for f in obj.fields:
+            t = self.resolve(f.type, obj.name.rpartition('.')[0]) if not isinstance(f.type, tuple) else None
+            if isinstance(t, Enum) and t.union:
+                slot += 1                                           # hidden <name>_type field
+            if 'id' in f.attrs:
+                slot = int(f.attrs['id'])
+            f.slot = slot
+            slot += 1
+        obj.slots = max((f.slot for f in obj.fields), default=-1) + 1
+
+    ###########################################################################
+    # encoding
+
+    def encode(self, value):
+        ''' Returns the FlatBuffer of `value`, a JSON object of the root type '''
+        builder = flatbuffers.Builder(1024)
+        root = self.table(builder, self.resolve(*self.root), value)
+        builder.Finish(root, self.identifier)
+        return bytes(builder.Output())
+
+    def table(self, builder, obj, value):
+        ''' Serializes like flatc: children in JSON order, then the fields
+            largest first and in reverse JSON order within a size '''
+        if not isinstance(value, dict):
+            raise RuntimeError(f'{obj.name}: expected an object')
+        ns = obj.name.rpartition('.')[0]
+        fields = {f.name: f for f in obj.fields}
+        stack = []                                                  # (size, add to table)
+        for key, val in value.items():
+            if key.endswith('_type') and key not in fields and key[:-5] in fields:
+                f = fields[key[:-5]]
+                t = self.field_type(f, ns)
+                stack.append((1, lambda f=f, v=t.value(val): builder.PrependUint8Slot(f.slot - 1, v, 0)))
+                continue
+            if key not in fields:
+                raise RuntimeError(f'{obj.name}: unknown field {key}')
+            f = fields[key]
+            if 'deprecated' in f.attrs:
+                continue
+            t = self.field_type(f, ns)
+            if isinstance(f.type, tuple):                           # children first, tables can't nest while building
+                off = self.vector(builder, t, val, ns)
+            elif t == 'string':
+                off = builder.CreateString(val)
+            elif isinstance(t, Enum) and t.union:
+                member = t.value(value[key + '_type'])
+                kind = self.resolve(next(k for k, v in t.values.items() if v == member), ns)
+                off = self.table(builder, kind, val)
+            elif isinstance(t, Compound) and not t.struct:
+                off = self.table(builder, t, val)
+            elif isinstance(t, Compound):
+                stack.append((4, lambda f=f, t=t, v=val: (self.struct(builder, t, v), builder.PrependStructSlot(f.slot, builder.Offset(), 0))))
+                continue
+            else:
+                size = SCALARS[t.base if isinstance(t, Enum) else t][1]
+                args = (self.flags(t), f.slot, self.scalar(t, val), self.scalar(t, f.default, 0))
+                stack.append((size, lambda args=args: builder.PrependSlot(*args)))
+                continue
+            stack.append((4, lambda f=f, off=off: builder.PrependUOffsetTRelativeSlot(f.slot, off, 0)))
+        builder.StartObject(obj.slots)
+        for size in (8, 4, 2, 1):
+            for (fsize, add) in reversed(stack):
+                if fsize == size:
+                    add()
+        return builder.EndObject()
+
+    def struct(self, builder, obj, value):
+        ns = obj.name.rpartition('.')[0]
+        builder.Prep(obj.align, obj.size)
+        end = obj.size
+        for f in reversed(obj.fields):
+            builder.Pad(end - f.offset - f.size)
+            t = self.field_type(f, ns)
+            if isinstance(t, Compound):
+                self.struct(builder, t, value[f.name])
+            else:
+                builder.Prepend(self.flags(t), self.scalar(t, value[f.name]))
+            end = f.offset
+
+    def vector(self, builder, t, items, ns):
+        if not isinstance(items, list):
+            raise RuntimeError('expected an array')
+        if t == 'string' or (isinstance(t, Compound) and not t.struct):
+            offs = [builder.CreateString(v) if t == 'string' else self.table(builder, t, v) for v in items]
+            builder.StartVector(4, len(offs), 4)
+            for off in reversed(offs):
+                builder.PrependUOffsetTRelative(off)
+        elif isinstance(t, Compound):
+            builder.StartVector(t.size, len(items), t.align)
+            for v in reversed(items):
+                self.struct(builder, t, v)
+        else:
+            size = SCALARS[t.base if isinstance(t, Enum) else t][1]
+            builder.StartVector(size, len(items), size)
+            for v in reversed(items):
+                builder.Prepend(self.flags(t), self.scalar(t, v))
+        return builder.EndVector()
+
+    def field_type(self, f, ns):
+        t = self.resolve(f.type[1] if isinstance(f.type, tuple) else f.type, ns)
+        if isinstance(t, Enum) and t.union and isinstance(f.type, tuple):
+            raise NotImplementedError(f'{f.name}: vector of unions')
+        return t
+
+    @staticmethod
+    def flags(t):
+        return SCALARS[t.base if isinstance(t, Enum) else t][0]
+
+    @staticmethod
+    def scalar(t, val, default = None):
+        if val is None:
+            return default
+        if isinstance(t, Enum):
+            return t.value(val)
+        if isinstance(val, str):                                    # schema defaults are tokens
+            val = {'true': True, 'false': False}.get(val, val)
+            if isinstance(val, str):
+                val = float(val) if t in ('float', 'float32', 'double', 'float64') else int(val, 0)
+        if t == 'bool':
+            return bool(val)
+        if t in ('float', 'float32', 'double', 'float64'):
+            return float(val)
+        if isinstance(val, float) and not val.is_integer():
+            raise RuntimeError(f'{val} is not an integer')
+        return int(val)
+
+###############################################################################
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4):
+        print(__doc__)
+        sys.exit(1)
+    with open(sys.argv[2], 'r') as f:
+        data = Schema.load(sys.argv[1]).encode(json.loads(f.read()))
+    output = sys.argv[3] if len(sys.argv) == 4 else os.path.splitext(os.path.basename(sys.argv[2]))[0] + '.bin'
+    with open(output, 'wb') as f:
+        f.write(data)
@@ -1,8 +1,15 @@
 import os
+import sys
 import argparse
 import json
 import swp
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pkg import OMAN
+from blockcache import BlockCache
+import delta
+import verify
+import phases
 from gensignature import SignatureGen as SEC
 import de_compress
 import magic
@@ -18,12 +25,18 @@ fileTypes['application/x-tar'] = 'Tar'                  # TAR file
 fileTypes['application/x-xz'] = 'Xz'                    # compressed TAR (.tar.xz)
 
 
+compressedTypes = ['Zip', 'Zlib', 'Gzip', 'Xz']        # artefact types not worth compressing again
+
 mapMethod = defaultdict(lambda: 'Error')
 mapMethod['compressChunks'] = True
 mapMethod['compressWhole'] = False
 
+detector = None                                         # libmagic detector, loaded once per process
+
 def file_type(file_path):
-    detector = magic.Magic(mime=True)
+    global detector
+    if detector is None:
+        detector = magic.Magic(mime=True)
     return detector.from_file(file_path)
 
 def controlAlgorithm(algo):
@@ -50,34 +63,87 @@ def range_type(astr, min=0, max=64535):
     else:
         raise argparse.ArgumentTypeError('value not in range %s-%s'%(min,max))
 ###############################################################################
-if __name__ == "__main__":
+# security + compression, created once per process and shared by its packages
+
+tools = {}
+
+def security(secpath, jobs = 1):
+    ''' Returns (signer, verifier, hasher map) for a key store '''
+    key = (os.path.abspath(secpath), jobs)
+    if key not in tools:
+        sec        = SEC()
+        signer     = swp.UCM.signer_factory (sec,
+                        swp.UCM.SignTypeDefinitions.RSA2048,
+                        secpath,
+                        keypath = 'ucm_dev_keypair.txt',
+                        jobs = jobs)
+        verifier   = swp.UCM.verifier_factory  (sec,
+                        swp.UCM.SignTypeDefinitions.RSA2048,
+                        secpath,
+                        keypath = 'ucm_dev_keypair.txt')
+        hasher_map = swp.UCM.hasher_map_factory(sec)
+        tools[key] = (signer, verifier, hasher_map)
+    return tools[key]
+
+def release():
+    ''' Shut down the signing processes of every key store loaded by security() '''
+    while tools:
+        (signer, verifier, hasher_map) = tools.popitem()[1]
+        if signer.get('close') is not None:
+            signer['close']()
+
+compressor = swp.UCM.initialize_compressor(de_compress.Compress)
+
+###############################################################################
+
+def arg_parser():
     parser = argparse.ArgumentParser(description="Generate swpkg.bin with specified output path")
     parser.add_argument("--container-format", help="Container format version (0x01xx), only 0x0106 supported")          #container format argument, must be 106
     parser.add_argument("--update-manifest-data", type=str, help="Path to SWPackage manifest data (json)")                                          #SWPackage manifest (Data (json) 
     parser.add_argument("--update-manifest-schema", type=str, help="Path to SWPackage manifest schema (fbs)")                                       #SWPackage manifest schema (fbs) files)
     parser.add_argument("--artefact", type=str, nargs=2, action='append', metavar=('value','method'), help="List of artefact files (e.g., artefact_0.tar) with their type of compressio, 'compressChunks' for chunks and 'compressWhole' for whole file")
-    parser.add_argument("--compress", type=str, default="None", help="specify compression algorithm (Available : zlib)")
+    parser.add_argument("--compress", type=str, default="None", choices=list(de_compress.SAlgos), help="specify compression algorithm")
+    parser.add_argument("--compress-profile", type=str, choices=de_compress.PROFILES, help="compression preset: fast, balanced or max. Defaults to the library default")
+    parser.add_argument("--adaptive", action='store_true', help="Skip compression of chunks that won't shrink (sampled) and of already compressed artefacts")
     parser.add_argument("--key-store", type=str, default=".", help="Path to the keystore, directory containing .der files")
     parser.add_argument("--block-size", type=range_type, metavar="[1-64535]", default=768, help="maximum data size for binary package generation")                  #max at 64536, whole block with sig, ... or only data ?
-    parser.add_argument("--verification", type=str, default="off", help="Turn On/Off write verification")
+    parser.add_argument("--verification", type=str, default="on", help="Turn On/Off verification of the written package (CRC, signatures, certificate), on by default")
     parser.add_argument("--verbose", action='store_true' , help="Verbose flag")
     parser.add_argument("--estimated-speed", type=int, help="Estimated speed of operation (In kB/s, this gives indication how fast UCMS can perform update)")
     parser.add_argument("--output", type=str, default="swpkg.bin", help="Output path for swpkg.bin")
-    parser.add_argument("--flatc-path", type=str, default=".", help="Flatbuffer compiler path")
+    parser.add_argument("--flatc-path", type=str, default=".", help="Deprecated, ignored: the update manifest is serialized in process")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of parallel workers for chunk compression (threads) and block signing (processes)")
+    parser.add_argument("--mmap", action='store_true', help="Memory map artefacts instead of reading them block by block")
     parser.add_argument("--configfile", type=str, help="Config file")
+    parser.add_argument("--cache", type=str, help="Directory of the block cache, unchanged blocks are neither compressed nor signed again")
+    parser.add_argument("--cache-size", type=int, default=1024, help="Size cap of the block cache in MB, least recently used blocks are evicted")
+    parser.add_argument("--delta-base", type=str, help="Directory of the previous artefacts, artefacts found there by name are sent as a delta")
+    parser.add_argument("--batch", type=str, nargs='+', metavar='config', help="Generate several packages, from config files holding one config or an array of configs")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of packages generated at the same time with --batch (processes)")
+    parser.add_argument("--profile", action='store_true', help="Write the time, bytes and calls of every phase per package and artefact to <output>_profile.json")
+    parser.add_argument("--profile-stats", action='store_true', help="With --profile, also dump a cProfile of the build to <output>_profile.pstats")
+    return parser
 
-    args = parser.parse_args()
-    argparse_dict = vars(args)                  # Changes key's format from x-y to x_y 
+def generate(argparse_dict):
+    ''' Generate one package from command line arguments and config file values, returns its path '''
+    if not argparse_dict.get('profile'):
+        return build(argparse_dict)
+    report = os.path.splitext(argparse_dict['output'])[0] + '_profile'
+    profile = phases.Profile(report + '.pstats' if argparse_dict.get('profile_stats') else None)
+    with profile.installed(sys.modules[__name__]):
+        OFile = build(argparse_dict)
+    profile.write(report + '.json', OFile)
+    print(f"{OFile}: profile written to {report}.json")
+    return OFile
+
+def build(argparse_dict):
+    ''' Generate one package, see generate '''
 
     ################### PARSING ARGS #####################
     # Parse json config file or cmdline argument
 
     Artefacts = []
-    if args.configfile is not None:
-        with open(args.configfile, 'r') as cfFile:
-            cfJson_string = cfFile.read()
-        config = json.loads(cfJson_string)
-        argparse_dict.update(config)
+    if argparse_dict.get('artefacts') is not None:
         Artefacts = argparse_dict['artefacts']
     else:
         if argparse_dict['artefact'] is not None:
@@ -90,31 +156,36 @@ if __name__ == "__main__":
     OFile = argparse_dict['output']
     KeyS = argparse_dict['key_store']
     Algo = argparse_dict['compress']
+    Profile = argparse_dict['compress_profile']
+    Adaptive = argparse_dict['adaptive']
     Speed = argparse_dict['estimated_speed']*(10**3)
-    flatcPath = argparse_dict['flatc_path']
+    Verif = str(argparse_dict['verification']).lower() == 'on'
+    Jobs = argparse_dict['jobs']
+    MMap = argparse_dict['mmap']
     CFor = supportedCFV(int(required(argparse_dict['container_format']),16))
 
     #######################################################
     # Prepare artefact dictionary
 
-    artefact_data = [{'data_kwargs': {'value': artefact_file['value']},'name' :os.path.basename(artefact_file['value']) , 'max_data_size': BSize, 'type' : fileTypes[file_type(artefact_file['value'])], 'method' : mapMethod[artefact_file['method']]} for artefact_file in Artefacts]
+    artefact_data = [{'data_kwargs': {'value': artefact_file['value']},'name' :os.path.basename(artefact_file['value']) , 'max_data_size': BSize, 'type' : fileTypes[file_type(artefact_file['value'])], 'method' : mapMethod[artefact_file['method']], 'compression' : artefact_file.get('compression', {})} for artefact_file in Artefacts]
+    for art, artefact_file in zip(artefact_data, Artefacts):
+        art['precompressed'] = art['type'] in compressedTypes
+        base = artefact_file.get('base')
+        if base is not None and not os.path.isfile(base):                                       # named explicitly, never sent in full by mistake
+            raise FileNotFoundError(f"{art['name']}: delta base {base} not found")
+        if base is None and argparse_dict.get('delta_base') is not None:
+            base = os.path.join(argparse_dict['delta_base'], art['name'])
+            if not os.path.isfile(base):                                                        # new artefact, sent in full
+                base = None
+        if base is not None:                                                                    # previous version known, send a patch
+            new = delta.read(artefact_file['value'])
+            (art['data_kwargs']['value'], copied) = delta.diff(delta.read(base), new)
+            art['delta'] = {'base': base, 'size': len(new), 'copied': copied,
+                            'hash': delta.HEADER.unpack_from(art['data_kwargs']['value'])[3].hex()}      # SHA-256 of the previous version
     swp_data = {'data_kwargs': {'value': Swp}, 'max_data_size': BSize , 'method' : mapMethod['compressWhole']}              #To unify processing for all blocks. Later, provider is none
     secpath = KeyS
 
-    ##############################################################################
-    # security + compression
-
-    sec        = SEC()
-    signer     = swp.UCM.signer_factory (sec,
-                    swp.UCM.SignTypeDefinitions.RSA2048,
-                    secpath,
-                    keypath = 'ucm_dev_keypair.txt')
-    verifier   = swp.UCM.verifier_factory  (sec,
-                    swp.UCM.SignTypeDefinitions.RSA2048,
-                    secpath,
-                    keypath = 'ucm_dev_keypair.txt')
-    hasher_map = swp.UCM.hasher_map_factory(sec)
-    compressor = swp.UCM.initialize_compressor(de_compress.Compress)
+    (signer, verifier, hasher_map) = security(secpath, Jobs)
 
     ###############################################################################
     # create software package
@@ -129,11 +200,92 @@ if __name__ == "__main__":
         'swp_data': swp_data,
         'swp_schema': SwpSch,
         'artefact': artefact_data,
-        'algorithm': {'None': 0,'zlib': 1}[controlAlgorithm(Algo) ],
-        'estimatedRate': Speed,
-        'flatcP': flatcPath
+        'algorithm': {'None': 0,'zlib': 1,'xz': 2,'bz2': 3,'zstd': 4,'lz4': 5}[controlAlgorithm(Algo) ],
+        'compressProfile': Profile,
+        'estimatedRate': Speed
     }
     output_dir = os.path.dirname(OFile)                                                         ## Create the output directory if it does not exist
     if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    swpkg.generate(spec, secpath, filename=OFile, signer=signer, verifier=verifier) 
+        os.makedirs(output_dir, exist_ok=True)
+    cache = None
+    if argparse_dict.get('cache') is not None:
+        cache = BlockCache(argparse_dict['cache'], argparse_dict['cache_size'] * 2**20)
+    # the full check below covers the field by field read-back of Container.writeVerification
+    swpkg.generate(spec, secpath, filename=OFile, signer=signer, verifier=verifier, verification=False, mmap=MMap, jobs=Jobs, adaptive=Adaptive,
+                   manifest=argparse_dict.get('enriched_manifest'), cache=cache)
+    if Verif:                                                                                   # full check of the written package, blocks are not verified while signing
+        (errors, warnings, size, seconds) = verify.verify(OFile, secpath, Jobs)
+        for message in warnings:
+            print(f"{OFile}: warning, {message}")
+        if errors:
+            raise RuntimeError(f"{OFile}: verification failed, {'; '.join(errors)}")
+        print(f"{OFile}: verified, {size / seconds / 2**20:.1f} MB/s")
+    if cache is not None:
+        cache.close()
+        print(f"{OFile}: {cache.stats()}")
+    if any('delta' in art for art in artefact_data):
+        print(f"{OFile}: projected download size {os.path.getsize(OFile)} bytes")
+    return OFile
+
+###############################################################################
+# batch generation
+
+def load_batch(paths):
+    ''' Returns the configs of batch files, each holding a config or an array of configs '''
+    configs = []
+    for path in paths:
+        with open(path, 'r') as cfFile:
+            config = json.loads(cfFile.read())
+        configs.extend(config if isinstance(config, list) else [config])
+    return configs
+
+def generate_batch(argparse_dict, configs, workers):
+    ''' Generate one package per config, command line arguments are the defaults of every config '''
+    packages = [dict(argparse_dict, **config) for config in configs]
+    outputs = [os.path.abspath(pack['output']) for pack in packages]
+    if len(set(outputs)) != len(outputs):
+        raise ValueError("Batch packages must have distinct outputs")
+    for pack in packages:                                                                       # packages may share an output directory
+        pack.setdefault('enriched_manifest', os.path.splitext(pack['output'])[0] + '_' + OMAN)
+        if workers > 1:
+            pack['jobs'] = 1                                                                    # packages run in parallel, no pools within workers
+    failed = []
+    if workers <= 1:
+        try:
+            for pack in packages:
+                try:
+                    print(f"{generate(pack)}: done")
+                except Exception as exc:
+                    failed.append(pack['output'])
+                    print(f"{pack['output']}: failed, {exc!r}")
+        finally:
+            release()                                                                           # signing pools are shared by the packages
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:                                  # every worker loads keys and detectors once
+            futures = [(pack['output'], pool.submit(generate, pack)) for pack in packages]
+            for (output, future) in futures:
+                try:
+                    print(f"{future.result()}: done")
+                except Exception as exc:
+                    failed.append(output)
+                    print(f"{output}: failed, {exc!r}")
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(packages)} packages failed: {', '.join(failed)}")
+
+###############################################################################
+if __name__ == "__main__":
+    args = arg_parser().parse_args()
+    argparse_dict = vars(args)                  # Changes key's format from x-y to x_y 
+
+    if args.batch is not None:
+        generate_batch(argparse_dict, load_batch(args.batch), args.workers)
+    else:
+        if args.configfile is not None:
+            with open(args.configfile, 'r') as cfFile:
+                cfJson_string = cfFile.read()
+            config = json.loads(cfJson_string)
+            argparse_dict.update(config)
+        try:
+            generate(argparse_dict)
+        finally:
+            release()
@@ -114,6 +114,38 @@ def process_command_line(argv):
             options['alg']     = arg
 
 
+#################################################################################
+# """
+#       Streaming CRC32 with the update/digest interface of the hashlib objects.
+#     The digest is the big endian CRC, int.from_bytes(digest, 'big') gives
+#     the value of binascii.crc32 over all the data.
+# """
+
+class CRC32(object):
+
+    name        = 'crc32'
+    digest_size = 4
+    block_size  = 1
+
+    def __init__(self, data = b''):
+        self.crc = binascii.crc32(data)
+
+    def update(self, data):
+        self.crc = binascii.crc32(data, self.crc)
+
+    def digest(self):
+        return self.crc.to_bytes(self.digest_size, 'big')
+
+    def hexdigest(self):
+        return self.digest().hex()
+
+    def copy(self):
+        other = CRC32()
+        other.crc = self.crc
+        return other
+
+#################################################################################
+
 class SignatureGen(object):
 
 
@@ -228,13 +260,14 @@ class SignatureGen(object):
 
         chosen_hash = hashes.SHA256()
 
-        rsa_key = serialization.load_der_private_key(
-            private_key,
-            password=None,
-            backend=default_backend()
-        )
+        if isinstance(private_key, (bytes, bytearray)):
+            private_key = serialization.load_der_private_key(
+                private_key,
+                password=None,
+                backend=default_backend()
+            )
         # Calculate the signature
-        signature = rsa_key.sign(
+        signature = private_key.sign(
             digest,
             padding.PKCS1v15(),
             utils.Prehashed(chosen_hash)
@@ -249,24 +282,20 @@ class SignatureGen(object):
 
         self.alg = hashtype
         if (self.alg == 'CRC32'):
-            self.obj =[]
+            self.obj = CRC32()
         else:
             self.obj = hashlib.new(self.alg)
         return self.obj
         
     def update_hash(self, data):
         
-        if (self.alg == 'CRC32'):
-            self.obj.append(data)
-        else:
-            self.obj.update(data)
+        self.obj.update(data)
         
     def generate_hash(self):
 
         size = 8
         if (self.alg == 'CRC32'):
-            data = b''.join(self.obj)
-            hash = (hex(binascii.crc32(data)))
+            hash = (hex(int.from_bytes(self.obj.digest(), 'big')))
         else:
             hash = self.obj.hexdigest()
             size = self.obj.digest_size
@@ -368,7 +397,9 @@ class SignatureGen(object):
 
     def verify_signature_rsa(self, pubkey, digest, sig):
         try:
-            public_key = serialization.load_der_public_key(pubkey, backend=default_backend())
+            public_key = pubkey
+            if isinstance(pubkey, (bytes, bytearray)):
+                public_key = serialization.load_der_public_key(pubkey, backend=default_backend())
             chosen_hash = hashes.SHA256()
             public_key.verify(
             sig,   
@@ -380,6 +411,73 @@ class SignatureGen(object):
         except Exception as e:
             print(f'Error: {e}')
             return False
+
+###############################################################################
+# Key store
+
+    def keystore(self, secpath):
+        return KeyStore.load(secpath)
+
+#################################################################################
+# """
+#       RSA key material of a key store directory. Each key is parsed once and
+#     the key objects are shared by every signer and verifier of the key store.
+# """
+
+class KeyStore(object):
+
+    PRIVATE_KEY = "SecureAuth_End_Entity-priv-key.der"
+    PUBLIC_KEY  = "SecureAuth_End_Entity-pub-key.der"
+    CERTIFICATE = "SecureAuth_End_Entity_cert.der"
+
+    _stores = {}
+
+    @classmethod
+    def load(cls, secpath):
+        path = os.path.abspath(secpath)
+        if path not in cls._stores:
+            cls._stores[path] = cls(path)
+        return cls._stores[path]
+
+    def __init__(self, secpath):
+        self.secpath      = secpath
+        self._private_key = None
+        self._public_key  = None
+        self._certificate = None
+
+    def read(self, name):
+        with open(os.path.join(self.secpath, name), "rb") as f:
+            return f.read()
+
+    @property
+    def private_key(self):
+        if self._private_key is None:
+            self._private_key = serialization.load_der_private_key(
+                self.read(self.PRIVATE_KEY),
+                password=None,
+                backend=default_backend()
+            )
+        return self._private_key
+
+    @property
+    def public_key(self):
+        if self._public_key is None:
+            self._public_key = serialization.load_der_public_key(
+                self.read(self.PUBLIC_KEY),
+                backend=default_backend()
+            )
+        return self._public_key
+
+    @property
+    def certificate(self):
+        if self._certificate is None:
+            self._certificate = self.read(self.CERTIFICATE)
+        return self._certificate
+
+    def sign(self, digest):
+        ''' RSA PKCS#1 v1.5 signature of a SHA-256 digest with the private key '''
+        return self.private_key.sign(digest, padding.PKCS1v15(), utils.Prehashed(hashes.SHA256()))
+
 #################################################################################
 
 if __name__ == "__main__":
@@ -0,0 +1,220 @@
+'''Per phase profile of a package build
+
+Usage, as gen_swp_fb.py --profile does:
+
+    profile = phases.Profile(stats = 'swpkg_profile.pstats')
+    with profile.installed(gen_swp_fb):
+        gen_swp_fb.build(args)
+    profile.write('swpkg_profile.json', 'swpkg.bin')
+
+While a profile is installed the functions doing the work of each phase
+are wrapped, so builds without --profile run the code unchanged. The report
+gives per phase, for the package and for every artefact, the wall and CPU
+time, the bytes processed, the throughput and the number of calls.
+
+Times are exclusive: a phase running inside another one, e.g. a write
+flushed by writeVerification, is only counted in the inner one. The bytes of
+write are the bytes added to the package: headers written again once their
+blocks are signed, e.g. ATAG and BIT, count once. CPU times
+are per thread. With --jobs, compressChunks blocks are compressed in
+threads, so their wall time overlaps the other phases, and blocks are
+signed in processes, so sign counts the wait for them.
+'''
+
+import os
+import json
+import time
+import bisect
+import threading
+import functools
+import contextlib
+import cProfile
+import bufferio
+import pkg
+import delta
+import verify
+import de_compress
+
+
+PHASES = ('manifest', 'libmagic', 'delta', 'read', 'compress', 'crc', 'sha256', 'sign', 'write', 'verification', 'writeVerification')
+
+###############################################################################
+
+class Counter:
+    ''' Time, bytes and calls of a phase '''
+
+    __slots__ = ('wall', 'cpu', 'bytes', 'calls')
+
+    def __init__(self):
+        self.wall  = 0.0
+        self.cpu   = 0.0
+        self.bytes = 0
+        self.calls = 0
+
+    def add(self, wall, cpu, size):
+        self.wall  += wall
+        self.cpu   += cpu
+        self.bytes += size
+        self.calls += 1
+
+    def report(self):
+        return {'wall': round(self.wall, 6),
+                'cpu': round(self.cpu, 6),
+                'bytes': self.bytes,
+                'MB/s': round(self.bytes / self.wall / 2**20, 3) if self.bytes and self.wall > 0 else None,
+                'calls': self.calls}
+
+def cover(spans, start, end):
+    ''' Add [start, end) to spans, sorted disjoint (start, end) tuples, and
+        return the number of bytes it adds to them '''
+    added = end - start
+    i = bisect.bisect_left(spans, (start,))
+    if i and spans[i - 1][1] >= start:
+        i -= 1
+    (low, high) = (start, end)
+    j = i
+    while j < len(spans) and spans[j][0] <= end:
+        (s, e) = spans[j]
+        added -= max(0, min(e, end) - max(s, start))
+        (low, high) = (min(low, s), max(high, e))
+        j += 1
+    spans[i:j] = [(low, high)]
+    return added
+
+class Profile:
+    """
+    Phase counters of one build, and optionally a cProfile of it.
+    """
+
+    def __init__(self, stats = None):
+        self.stats     = stats                                              # path of the pstats dump, None for none
+        self.phases    = {phase: Counter() for phase in PHASES}
+        self.artefacts = {}                                                 # name: (Counter of the artefact, phase counters)
+        self.artefact  = None                                               # artefact being processed
+        self.lock      = threading.Lock()
+        self.local     = threading.local()
+        self.patched   = []
+        self.written   = {}                                                 # output: spans of the file written so far
+        self.wall      = 0.0
+        self.cpu       = 0.0
+
+    def add(self, phase, wall, cpu, size):
+        with self.lock:
+            self.phases[phase].add(wall, cpu, size)
+            if self.artefact is not None:
+                self.artefacts[self.artefact][1][phase].add(wall, cpu, size)
+
+    def timed(self, phase, function, size = None):
+        ''' Wrapper of function counting its calls in phase, size gives the bytes of a call from its arguments '''
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            nbytes = size(*args, **kwargs) if size is not None else 0
+            stack = self.local.__dict__.setdefault('stack', [])           # [wall, cpu] of the inner phases, per running phase
+            stack.append([0.0, 0.0])
+            (wall, cpu) = (time.perf_counter(), time.thread_time())
+            try:
+                return function(*args, **kwargs)
+            finally:
+                (wall, cpu) = (time.perf_counter() - wall, time.thread_time() - cpu)
+                (inner_wall, inner_cpu) = stack.pop()
+                if stack:
+                    stack[-1][0] += wall
+                    stack[-1][1] += cpu
+                self.add(phase, wall - inner_wall, cpu - inner_cpu, nbytes)
+        return wrapper
+
+    def within(self, process):
+        ''' Wrapper of BList.process, counting the phases of the artefact it processes '''
+        @functools.wraps(process)
+        def wrapper(blocks, kwargs, art = None):
+            name = art['name'] if art is not None else 'manifest'
+            self.artefacts.setdefault(name, (Counter(), {phase: Counter() for phase in PHASES}))
+            self.artefact = name
+            (wall, cpu) = (time.perf_counter(), time.process_time())
+            try:
+                return process(blocks, kwargs, art)
+            finally:
+                self.artefacts[name][0].add(time.perf_counter() - wall, time.process_time() - cpu, blocks.uncompressedS)
+                self.artefact = None
+        return wrapper
+
+    def signer(self, signer):
+        ''' Copy of a signer, its signatures counted in phase sign '''
+        timed = dict(signer, sign = self.timed('sign', signer['sign'], len))
+        if 'sign_all' in signer:
+            timed['sign_all'] = self.timed('sign', signer['sign_all'], lambda digests: sum(map(len, digests)))
+        return timed
+
+    def fresh(self, output):
+        ''' Bytes a flush of output adds to the file, rewritten ones are not counted '''
+        if not output.buff:
+            return 0
+        with self.lock:
+            return cover(self.written.setdefault(output, []), output.start, output.start + len(output.buff))
+
+    def patch(self, owner, name, wrapper):
+        self.patched.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, wrapper)
+
+    @contextlib.contextmanager
+    def installed(self, generator):
+        ''' Instrument the phases of the generator module and of the modules it uses '''
+        security = generator.security
+        def secured(*args, **kwargs):
+            (signer, verifier, hasher_map) = security(*args, **kwargs)
+            return (self.signer(signer), verifier, hasher_map)
+        read = lambda src, offset, size: max(0, min(size, src.size - offset))
+        data = lambda blk, packed = False: blk['DATA'].size or 0
+        self.patch(generator,             'security',          secured)
+        self.patch(generator,             'file_type',         self.timed('libmagic', generator.file_type))
+        self.patch(delta,                 'diff',              self.timed('delta', delta.diff, lambda old, new: len(new)))
+        self.patch(pkg.Container,         'manifestUpdate',    self.timed('manifest', pkg.Container.manifestUpdate))
+        self.patch(pkg.Container,         'writeVerification', self.timed('writeVerification', pkg.Container.writeVerification,
+                                                                          lambda package: package['ATAG']['TS'].value))
+        self.patch(bufferio.BList,        'process',           self.within(bufferio.BList.process))
+        self.patch(bufferio.Source,       'read',              self.timed('read', bufferio.Source.read, read))
+        self.patch(bufferio.Buffer,       'read',              self.timed('read', bufferio.Buffer.read, read))
+        self.patch(de_compress.Compress,  'compress_data',     self.timed('compress', de_compress.Compress.compress_data,
+                                                                          lambda compressor, chunk: len(chunk)))
+        self.patch(bufferio.Chunker,      'push',              self.timed('compress', bufferio.Chunker.push,
+                                                                          lambda chunker, chunk, size, last = False: len(chunk)))
+        self.patch(pkg.BLOCK,             'checksum',          self.timed('crc', pkg.BLOCK.checksum, data))
+        self.patch(pkg.BLOCK,             'digest',            self.timed('sha256', pkg.BLOCK.digest, data))
+        self.patch(bufferio.Output,       'flush',             self.timed('write', bufferio.Output.flush, self.fresh))
+        self.patch(verify,                'verify',            self.timed('verification', verify.verify,
+                                                                          lambda path, *args, **kwargs: os.path.getsize(path)))
+        profiler = cProfile.Profile() if self.stats is not None else None
+        (wall, cpu) = (time.perf_counter(), time.process_time())
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield self
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(self.stats)
+            (self.wall, self.cpu) = (time.perf_counter() - wall, time.process_time() - cpu)
+            while self.patched:
+                (owner, name, original) = self.patched.pop()
+                setattr(owner, name, original)
+
+    ###########################################################################
+
+    @staticmethod
+    def counters(phases):
+        return {phase: counter.report() for phase, counter in phases.items() if counter.calls}
+
+    def report(self, package = None):
+        phases = self.counters(self.phases)
+        return {'package': package,
+                'wall': round(self.wall, 6),
+                'cpu': round(self.cpu, 6),
+                'other': round(self.wall - sum(counter.wall for counter in self.phases.values()), 6),
+                'phases': phases,
+                'artefacts': {name: dict(total.report(), phases = self.counters(counters))
+                              for name, (total, counters) in self.artefacts.items()},
+                'pstats': self.stats}
+
+    def write(self, path, package = None):
+        with open(path, 'w') as f:
+            json.dump(self.report(package), f, indent = 2)
@@ -1,21 +1,23 @@
 import io
 import os
+import mmap
+import array
+import collections
 import bufferio
+import flatbuf
 import json
 import sys
-import binascii
 from enum import Enum
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import utils
-from cryptography.hazmat.primitives.asymmetric import padding
 import struct
+import hashlib
+from gensignature import KeyStore
 
 
 #MAX_CHUNK_SIZE = 60000                              #max data block size is 64000 so max chunk size must approx 60000. >>temporary solution
 TEMPOF = 'temporaryFile'
-FLATC_ARGS = ' -c -b '
 OMAN = "enriched_update_manifest.json"
+DELTA = ('patchSize', 'deltaUpdate', 'deltaBaseHash')   # manifest fields of delta artefacts, in the FlatBuffer when the schema has them
+CSS = 256                                       # certificate signature size, RSA2048 with the key store key whatever signs the blocks
 #flatcBin = 'swp__test_swp_flatcfg_one_file.bin'
 
 ###############################################################################
@@ -28,6 +30,8 @@ class BTD(Enum):
     UCM_SOFTWARE_PACKAGE_APPLICATION       = 0x0005
     UCM_SOFTWARE_PACKAGE_BINARY_IMAGE      = 0x0007
     BLOCK_INDEX_TABLE                      = 0x0009
+    UCM_SOFTWARE_PACKAGE_APPLICATION_DELTA = 0x000B                    # delta.py patch of the previous version
+    UCM_SOFTWARE_PACKAGE_BINARY_IMAGE_DELTA= 0x000D
 
 class CTYPE(Enum):
     NO_COMPRESSION                         = 0x0000
@@ -37,65 +41,80 @@ class CTYPE(Enum):
 class CALGO(Enum):
     NONE                                   = 0x0000
     ZLIB                                   = 0x0001
+    XZ                                     = 0x0002
+    BZ2                                    = 0x0003
+    ZSTD                                   = 0x0004
+    LZ4                                    = 0x0005
 
 class CFLAG(Enum):
     NOT_COMPRESSED                         = 0x0000
     COMPRESSED                             = 0x0001
 ###############################################################################
 
-class BITR(bufferio.Dict):
+class BITR(bufferio.Record):
 # @NOTE class definition doesnt strictly follow defined anatomy
 
-    def __init__(self):
-        super().__init__({
-            'OFFT':    bufferio.CType(fmt = 'Q'),
-            'TSIZE':   bufferio.CType(fmt = 'Q'),
-            'SIZE':    bufferio.CType(fmt = 'Q'),            # @16
-            'COUNT':   bufferio.CType(fmt = 'Q'),
-            'GROUP':   bufferio.CType(fmt = 'L'),
-            'IDENT':   bufferio.CType(fmt = 'H'),
-            'ADSIZE':  bufferio.CType(fmt = 'H'),
-            'CTYPE':   bufferio.CType(fmt = 'H'),
-            'CALGO':   bufferio.CType(fmt = 'H'),
-            'PAD':     bufferio.CType(fmt = 'L')
-            # compression
-            })
+    FIELDS = (
+        ('OFFT',    'Q'),
+        ('TSIZE',   'Q'),
+        ('SIZE',    'Q'),                       # @16
+        ('COUNT',   'Q'),
+        ('GROUP',   'L'),
+        ('IDENT',   'H'),
+        ('ADSIZE',  'H'),
+        ('CTYPE',   'H'),
+        ('CALGO',   'H'),
+        ('PAD',     'L'),
+        # compression
+        )
+    __slots__ = tuple(name for name, code in FIELDS)
 
     def generate(self, spec):
-        self['IDENT'].value     = spec['IDENT']
-        self['GROUP'].value     = spec['GROUP']
-        self['CTYPE'].value     = spec['CTYPE']
-        self['CALGO'].value     = spec['CALGO']
-        self['TSIZE'].value     = 0
-        self['COUNT'].value     = 0
-        self['ADSIZE'].value    = 0
-        self['PAD'   ].value    = 0
-        
+        self.IDENT     = spec['IDENT']
+        self.GROUP     = spec['GROUP']
+        self.CTYPE     = spec['CTYPE']
+        self.CALGO     = spec['CALGO']
+        self.TSIZE     = 0
+        self.COUNT     = 0
+        self.ADSIZE    = 0
+        self.PAD       = 0
 
-    def finalWrite(self):
-        for obj in self.values():
-            obj.write()
+    finalWrite = bufferio.Record.write
 
 ###############################################################################
 
+class ATAGHEAD(bufferio.Record):
+    ''' Fixed part of ATAG, before the signature data block '''
+
+    FIELDS = (
+        ('TS',      'Q'),
+        ('CFV',     'L'),
+        ('ATAGS',   'L'),                       # @16
+        ('VTAG',    'L'),
+        ('BHT',     'H'),
+        ('BSS',     'H'),                       # spec uses legacy 'BST'
+        ('CRC',     'L'),
+        ('PAD',     'L'),
+        ('SDP',     'Q'),
+        )
+    __slots__ = tuple(name for name, code in FIELDS)
+
 class ATAG(bufferio.Dict):
 # @NOTE class definition doesnt strictly follow defined anatomy
 
     def __init__(self, maps):
         self.maps = maps
+        self.head = ATAGHEAD()
         super().__init__({
-            'TS':     bufferio.CType(fmt = 'Q'),
-            'CFV':    bufferio.CType(fmt = 'L'),
-            'ATAGS':  bufferio.CType(fmt = 'L'),            # @16
-            'VTAG':   bufferio.CType(fmt = 'L'),
-            'BHT':    bufferio.CType(fmt = 'H'),
-            'BSS':    bufferio.CType(fmt = 'H'), # spec uses legacy 'BST'
-			'CRC':    bufferio.CType(fmt = 'L'),
-            'PAD':    bufferio.CType(fmt = 'L'),
-            'SDP':    bufferio.CType(fmt = 'Q'),
+            'HEAD':   self.head,                    # TS, CFV, ATAGS, VTAG, BHT, BSS, CRC, PAD, SDP
             'SDB':    bufferio.ByteArray()
             })
 
+    def __getitem__(self, key):
+        if key in ATAGHEAD.offsets:                                     # fixed fields, as CType
+            return bufferio.Field(self.head, key)
+        return self.data[key]
+
     def generate(self, spec):
         self['CFV'   ].value = spec['tag']['CFV'   ]
         self['VTAG'  ].value = spec['tag']['VTAG'  ]
@@ -106,17 +125,17 @@ class ATAG(bufferio.Dict):
         self['SDP'   ].value = 0
 
     def update(self):
-        self['SDB'  ].size  = self['BSS'].value + self['BSS'].value + 949 #Auth. sign. size + Certificate Sign. size + Cert. size       #fixed size for Cert. size ?
+        self['SDB'  ].size  = self['BSS'].value + CSS + 949 #Auth. sign. size + Certificate Sign. size (RSA2048 of the key store) + Cert. size       #fixed size for Cert. size ?
         super().update()
         self['ATAGS'].value = self.size
         self['ATAGS'].update()
 
-    def sign(self, secpath, signer):
+    def sign(self, secpath, signer, certificate = None):
         ############################### CRC ##################################
         if(self['CFV'].value == 0x0106 or self['CFV'].value == 0x0102):
             crc = self.maps['hasher'](1)
             self.hash(crc)
-            self['CRC'].value = binascii.crc32(b''.join(crc))
+            self['CRC'].value = int.from_bytes(crc.digest(), 'big')
             self['CRC'].write()
             self.update()
         else:
@@ -128,30 +147,12 @@ class ATAG(bufferio.Dict):
             self.hash(hasher, True)
             sig = signer(hasher.digest())
             self['SDB'].value = sig
-            certificate_file = "SecureAuth_End_Entity_cert.der"
-            cert_path = os.path.join(secpath, certificate_file)
-            with open(cert_path, 'rb') as f:
-                certificate_text = f.read()
-            key_file = "SecureAuth_End_Entity-priv-key.der"
-            key_path = os.path.join(secpath, key_file)
-            with open(key_path, "rb") as f:
-                    private_key = f.read()
-            chosen_hash = hashes.SHA256()
-            hasher = hashes.Hash(chosen_hash, backend=default_backend())
-            hasher.update(certificate_text)
-            digest = hasher.finalize()
-            rsa_key = serialization.load_der_private_key(
-                private_key,
-                password=None,
-                backend=default_backend()
-            )
-            # Calculate the signature
-            certificate_sign = rsa_key.sign(
-                digest,
-                padding.PKCS1v15(),
-                utils.Prehashed(chosen_hash)
-            )
-            self['SDB'].value += certificate_text + certificate_sign
+            keys = KeyStore.load(secpath)
+            if certificate is None:                                         # no certificate handed over by the signer, read from key store
+                certificate = keys.certificate
+            # the certificate is always signed with the RSA key of the key store, over its SHA-256
+            certificate_sign = keys.sign(hashlib.sha256(certificate).digest())
+            self['SDB'].value += certificate + certificate_sign
             self['SDB'].size = len(self['SDB'].value)
             self.update()
         else:
@@ -160,10 +161,8 @@ class ATAG(bufferio.Dict):
         ######################################################################
 
     def hash(self, hasher, SIG = False):
-        if SIG:
-            self.hash_all_but(['SDB'], hasher)
-        else :
-            self.hash_all_but(['SDB','CRC'], hasher)
+        ''' Hash the fixed fields, without CRC unless SIG '''
+        hasher.update(self.head.pack() if SIG else self.head.pack_but('CRC'))
 
     def verify(self, verifier):
         if(self['CFV'].value == 0x0106 or self['CFV'].value == 0x0104):
@@ -174,12 +173,26 @@ class ATAG(bufferio.Dict):
             return True
 
     def finalWrite(self):
-        for obj in self.values():
-            obj.write()
+        ''' Write fixed fields and SDB at once '''
+        self.output.seek(self.position, io.SEEK_SET)
+        self.output.write(self.pack())
 
 
 ###############################################################################
 
+class HEAD(bufferio.Record):
+    ''' Fixed part of a BLOCK header, one record instead of a CType per field '''
+
+    FIELDS = (
+        ('SIZE',    'Q'),                       #@64
+        ('GROUP',   'L'),                       #@32
+        ('SEQ',     'L'),
+        ('CRC',     'L'),
+        ('CFLAG',   'H'),
+        ('PAD',     'H'),
+        )
+    __slots__ = tuple(name for name, code in FIELDS)
+
 class BLOCK(bufferio.Dict):
 # @NOTE class definition doesnt strictly follow defined anatomy
 
@@ -187,17 +200,18 @@ class BLOCK(bufferio.Dict):
         self.tag  = tag
         self.maps = maps
         self.bit  = bit
+        self.head = HEAD()
         super().__init__({
-            'SIZE':    bufferio.CType(fmt = 'Q'),   #@64
-            'GROUP':   bufferio.CType(fmt = 'L'),   #@32
-            'SEQ':     bufferio.CType(fmt = 'L'),
-            'CRC':     bufferio.CType(fmt = 'L'),
-            'CFLAG':   bufferio.CType(fmt = 'H'),
-            'PAD':     bufferio.CType(fmt = 'H'),   # 
+            'HEAD':    self.head,                   # SIZE, GROUP, SEQ, CRC, CFLAG, PAD
             'SIG':     bufferio.ByteArray(),
             'DATA':    None                         # data_type_map[IDENT]
             })
 
+    def __getitem__(self, key):
+        if key in HEAD.offsets:                                         # header fields, as CType
+            return bufferio.Field(self.head, key)
+        return self.data[key]
+
     def __updateBlockMetadata(self, bds_, rem, off, seq):               #Private method to update block's metadata
             bds  = bds_ if rem > bds_ else rem
             self['DATA'].size    = bds
@@ -209,7 +223,10 @@ class BLOCK(bufferio.Dict):
             return (bds_, rem, off, seq)
 
     @staticmethod
-    def generator(tag, maps, bit, spec, rem = None):
+    def generator(tag, maps, bit, spec, rem = None, spare = False):
+        ''' Yields the BLOCKs of spec's data, one per max_data_size bytes. With spare
+            it then keeps yielding empty ones, for a whole compressed artefact
+            whose payloads outnumber its chunks '''
         blk = BLOCK(tag ,maps, bit)
         blk.generate(spec)
         bds_ = spec['data']['args'].get('max_data_size')
@@ -232,7 +249,7 @@ class BLOCK(bufferio.Dict):
             rem  = blk['DATA'].size
         (bds_, rem, off, seq) = blk.__updateBlockMetadata(bds_, rem, off, seq)
         yield blk        
-        while rem > 0:
+        while rem > 0 or spare:
             blk = BLOCK(tag, maps, bit)
             blk.generate(spec)
             (bds_, rem, off, seq) = blk.__updateBlockMetadata(bds_, rem, off, seq)
@@ -253,58 +270,75 @@ class BLOCK(bufferio.Dict):
         self['SIG' ].size       = tag ['BSS'  ].value
         self['DATA']            = Data(**kwargs)                    # puts already defined 'value' to corresponding key 'value' in Data type. e.g. self['DATA] = bufferio.file(**{'value' : 'test.tar'})
 
-    def sign(self, signer):
-        ''' Sign BLOCK and write signature to output file in corresponding position '''
-        ##########   CRC   ##########
+    def sign(self, signer, packed = False):
+        ''' Sign BLOCK and write signature to output file in corresponding position.
+            If packed, hash the python values and leave the write to the caller '''
+        self.checksum(packed)
+        digest = self.digest(packed)
+        self.signature(None if digest is None else signer(digest), packed)
+
+    def checksum(self, packed = False):
+        ''' Compute CRC of BLOCK, written to output file unless packed '''
         if(self.tag['CFV'].value == 0x0106 or self.tag['CFV'].value == 0x0102):
             crc = self.maps['hasher'](1)
-            self.hash(crc)
-            self['CRC'].value = binascii.crc32(b''.join(crc))
-            self['CRC'].write()
-        else:
+            self.hash(crc, packed = packed)
+            self['CRC'].value = int.from_bytes(crc.digest(), 'big')
+            if not packed:
+                self['CRC'].write()
+        elif not packed:
             self.output.seek(self['CRC'].position, io.SEEK_SET)
             self.output.write(b'\0' * self['CRC'].size)
-        ########## SIGNING ##########
+
+    def digest(self, packed = False):
+        ''' Digest to be signed, None if container format has no signature '''
         if(self.tag['CFV'].value == 0x0106 or self.tag['CFV'].value == 0x0104):
             hasher = self.maps['hasher'](self.tag['BHT'].value)
-            self.hash(hasher, True)
-            sig = signer(hasher.digest())
+            self.hash(hasher, True, packed)
+            return hasher.digest()
+        return None
+
+    def signature(self, sig, packed = False):
+        ''' Set signature of BLOCK, written to output file unless packed '''
+        if sig is not None:
             if len(sig) != self['SIG'].size:
                 raise RuntimeError('Different reserved and actual signature size')
             self['SIG'].value = sig
-            self['SIG'].write()
-        else:
+            if not packed:
+                self['SIG'].write()
+        elif not packed:
             self.output.seek(self['SIG'].position, io.SEEK_SET)
             self.output.write(b'\0' * self['SIG'].size)
 
     def update(self):
         ''' Sync all python values with binary values '''
         super().update()
-        self['SIZE'].value = self.size
-        self['SIZE' ].update()
+        self.head.SIZE = self.size
 
-    def hash(self, hasher, SIG = False):
-        if SIG:
-            self.hash_all_but(['SIG'], hasher)
-        else :
-            self.hash_all_but(['SIG','CRC'], hasher)
+    def hash(self, hasher, SIG = False, packed = False):
+        ''' Hash header and DATA, without SIG, and without CRC unless SIG '''
+        hasher.update(self.head.pack() if SIG else self.head.pack_but('CRC'))
+        if packed:
+            self['DATA'].hash_packed(hasher)
+        else:
+            self['DATA'].hash(hasher)
 
-    def verify(self, verifier):
+    def verify(self, verifier, packed = False):
         ''' Verify signature of BLOCK'''
-        if(self.tag['CFV'].value == 0x0106 or self.tag['CFV'].value == 0x0104):
-            hasher = self.maps['hasher'](self.tag['BHT'].value)
-            self.hash(hasher, True)
-            return verifier(self['SIG'].value, hasher.digest())
+        digest = self.digest(packed)
+        if digest is not None:
+            return verifier(self['SIG'].value, digest)
         else :
             return True
 
     def headSize(self):
         return self.size - self['DATA'].size
 
-    def compress(self, method, compressor, chunk):
-        ''' Compress data chunk if method is 'ch' and test if compression is beneficial '''
+    def compress(self, method, compressor, chunk, C_chunk = None):
+        ''' Compress data chunk if method is 'ch' and test if compression is beneficial.
+            C_chunk is the chunk when already compressed by the caller '''
         if method:
-            C_chunk = compressor.compress_data(chunk)
+            if C_chunk is None:
+                C_chunk = compressor.compress_data(chunk)
             if len(chunk) > len(C_chunk):
                 self['CFLAG'].value = CFLAG.COMPRESSED.value
                 return C_chunk
@@ -314,12 +348,50 @@ class BLOCK(bufferio.Dict):
     def finalWrite(self, chunk = None):
         self.update()
         ''' Write to output file without SIG and DATA '''
-        for obj in self.values():
-            if obj != self['SIG'] and obj != self['DATA']:
-                obj.write()
+        self.head.write()
         if chunk is not None:
             self['DATA'].write(chunk)
 
+    def stream(self, chunk, signer, verifier = None):
+        ''' Write whole BLOCK once, CRC and signature computed while the chunk is in memory '''
+        digest = self.load(chunk)
+        self.signature(None if digest is None else signer(digest), True)
+        self.dump(verifier)
+
+    def restore(self, entry, verifier = None):
+        ''' Take payload, CRC and signature of a cached BLOCK and place it. False,
+            and the BLOCK left unplaced, if its CRC or signature does not match '''
+        (cflag, crc, sig, payload) = entry
+        self['CFLAG'].value = cflag
+        self['DATA'].chunk  = payload
+        self['DATA'].size   = len(payload)
+        self.head.SIZE      = self.size                                 # checked before update() places the BLOCK at its size
+        self['CRC'].value   = crc
+        self.checksum(True)
+        if self['CRC'].value != crc or (sig is not None and len(sig) != self['SIG'].size):
+            return False
+        self.signature(sig, True)
+        if verifier is not None and not self.verify(verifier, True):
+            return False
+        self.update()
+        return True
+
+    def load(self, chunk):
+        ''' Take chunk as in memory payload, place BLOCK and return the digest to be signed '''
+        self['DATA'].chunk = chunk
+        self['DATA'].size  = len(chunk)
+        self.update()
+        self.checksum(True)
+        return self.digest(True)
+
+    def dump(self, verifier = None):
+        ''' Verify and write loaded BLOCK in a single write, then release the payload '''
+        if verifier is not None and not self.verify(verifier, True):
+            raise RuntimeError('Signature verification failed')
+        self.output.seek(self.position, io.SEEK_SET)
+        self.output.writelines(obj.pack() for obj in self.values())
+        self['DATA'].chunk = None
+
  ###############################################################################
 
 class BIT(BLOCK):
@@ -341,13 +413,9 @@ class BIT(BLOCK):
             self['DATA'].append(bitr) ##Data section in the 2nd block(BIT) has BITR info
     
     def finalWrite(self):
-        ''' Write whole block to output file at exact position '''
-        for obj in self.values():
-            if obj != self['DATA']:
-                obj.write()
-            else:
-                for item in obj:
-                    item.finalWrite()   
+        ''' Write whole block to output file at exact position, in one write '''
+        self.output.seek(self.position, io.SEEK_SET)
+        self.output.write(self.pack())
 
 ###############################################################################
 
@@ -362,13 +430,8 @@ class Container(bufferio.Dict):
             })
 
     def start_blocks(self):
-        ''' Returns starting blocks'''
-        bl = []
-        for lis in self['BLOCKS']:
-            for blk in lis:
-                if blk['SEQ'].value == 0:
-                    bl.append(blk)
-        return bl
+        ''' Returns starting blocks, header records of the first written blocks once processed'''
+        return [lis[0] if lis else lis.first for lis in self['BLOCKS']]
 
     def generate(self, spec, secpath, **kwargs):
         ''' Create actual output binary '''
@@ -379,56 +442,61 @@ class Container(bufferio.Dict):
         bit = self['BIT' ]['DATA']
                                                                                         # Instantiate all needed blocks for the data inside the self['BLOCKS] dictionary
         for i,item in enumerate(spec.get('blocks', [])):
-            blks = bufferio.BList(item['data']['args']['method'], self.maps['compressor'](spec['algorithm']), [*BLOCK.generator(tag, self.maps, bit, item)])
-            bit [i]['COUNT'].value = len(blks)
+            args = item['data']['args']
+            compressor = self.maps['compressor'](spec['algorithm'], spec.get('compressProfile'), **args.get('compression', {}))    # per artefact tuning
+            whole = not args['method'] and compressor.algorithm != 'None'                          # cut by the chunker of the BList
+            blks = bufferio.BList(args['method'], compressor, BLOCK.generator(tag, self.maps, bit, item, spare = whole),
+                                  kwargs.get('adaptive', False), kwargs.get('adaptive', False) and args.get('precompressed', False),
+                                  args.get('max_data_size'))
+            if kwargs.get('cache') is not None and kwargs['signer'].get('fingerprint') is not None:     # everything CRC and signature depend on, but SEQ and the chunk
+                blks.params = json.dumps([tag['CFV'].value, tag['BHT'].value, item['CALGO'], item['CTYPE'], args.get('max_data_size'),
+                                          compressor.algorithm, compressor.settings, kwargs.get('adaptive', False), kwargs['signer']['fingerprint'], item['GROUP']])
             self['BLOCKS'].append(blks)
             
         if kwargs.get('filename') is not None:
-            with open (kwargs['filename'], 'w+b') as buf:                               ## Open output file for the whole procedure
+            with bufferio.Output(kwargs['filename']) as buf:                               ## Open output file for the whole procedure
                 self.output = buf                                                       ## take output buffer for the whole pkg
                 self.setup()
                 CUCSizes = []
                 actualManifest = self['BLOCKS'][0].getValue()
-                MAN_list = self.manifestUpdate(spec, buf, actualManifest)[0]
-                MAN_list.update()
-                estimatedSize = MAN_list.size
-
-                ################################################## ARTEFACTS PROCESSIN #################################
                 with open(actualManifest, 'r') as pFile:
                     pJson_string = pFile.read()
                 swp_manifest = json.loads(pJson_string)
 
-                for lis,art in zip(self['BLOCKS'][1:], swp_manifest['Artefact']):                                          ## Sweep all artefact blocks fill the Data key, sign + veirfy it and write in the corresponding position.
+                ################################################## ARTEFACTS PROCESSIN #################################
+                # Artefact groups are laid out right after ATAG + BIT, the manifest group follows them once its sizes are known
+                for lis,art,item in zip(self['BLOCKS'][1:], swp_manifest['Artefact'], spec.get('blocks', [])[1:]):     ## Sweep all artefact blocks fill the Data key, sign + veirfy it and write in the corresponding position.
                     CUCSizes.append(lis.process( kwargs, art))
-                ################################################## MANIFEST REFRESHIN ##################################
-                #open Manifest and rewrite the needed infos                
-                swp_manifest['SWPackage'][0]['uncompressedSoftwareClusterSize']= sum(lis.uncompressedS for lis in self['BLOCKS'][1:])
+                    if kwargs.get('adaptive') and lis.method:
+                        print(f"{art['name']}: {lis.skipped} of {len(lis)} chunks stored without compression")
+                    delta = item['data']['args'].get('delta')
+                    if delta is not None:                                                   # sent as a patch, the manifest keeps the artefact size
+                        art.update(uncompressedSize = delta['size'], patchSize = lis.uncompressedS, deltaUpdate = True, deltaBaseHash = delta['hash'])
+                        print(f"{art['name']}: delta against {delta['base']}, {CUCSizes[-1]} bytes for {delta['size']} bytes ({delta['copied']} copied)")
+                ################################################## MANIFEST ############################################
+                #complete Manifest with the sizes of the processed artefacts
+                swp_manifest['SWPackage'][0]['uncompressedSoftwareClusterSize']= sum(art['uncompressedSize'] for art in swp_manifest['Artefact'])
                 swp_manifest['SWPackage'][0]['estimatedDurationOfOperation'] = round(swp_manifest['SWPackage'][0]['uncompressedSoftwareClusterSize'] / spec['estimatedRate'])
                 swp_manifest['SWPackage'][0]['compressedSoftwarePackageSize']= sum(CUCSizes)
                 pJson_string = json.dumps(swp_manifest)
-                outputManifest = os.path.dirname(os.path.abspath(kwargs.get('filename'))) + '/' + OMAN
+                outputManifest = kwargs.get('manifest') or os.path.dirname(os.path.abspath(kwargs.get('filename'))) + '/' + OMAN
                 with open(outputManifest, 'w') as pFile:
                     pFile.write(pJson_string)
-                originalPos = self['BLOCKS'][0].position
-                MAN_list = self.manifestUpdate(spec, buf, outputManifest, True)[0]
-                MAN_list.position = originalPos
-                MAN_list.process( kwargs)                                               ## MANIFEST list processing
+                MAN_list = self.manifestUpdate(spec, buf, swp_manifest)
+                MAN_list.process( kwargs)                                               ## MANIFEST list processing, placed after the last artefact block
                 self.save()
-                # Updating Total size value as we do not take into consideration the pading
-                self['ATAG']['TS'].value -= self['BIT']['DATA'][0]['TSIZE'].value
-                self['ATAG']['TS'].value += estimatedSize
-                self.align()
                 self['ATAG'].finalWrite()                                               # Final write for ATAG + BIT
                 self['BIT'].finalWrite()
                 ##################################################### ATAG + BIT ########################################
-                self.sign(secpath, kwargs['signer']['sign'])                            # Signing ATAG + BIT
+                self.sign(secpath, kwargs['signer']['sign'], kwargs['signer'].get('certificate'))     # Signing ATAG + BIT
                 if kwargs.get('verifier') is not None:                                  # Signature verif ATAG + BIT
                     if not self.verify(kwargs['verifier']):
                         raise RuntimeError('Signature verification failed')
                 self['ATAG'].finalWrite()                                               # Final write for ATAG + BIT
                 self['BIT'].finalWrite()
                 ##################################################### VERIFICATION #######################################
-                self.writeVerification()
+                if kwargs.get('verification', True):
+                    self.writeVerification()
                 ##################################################### PROGR. ENDED #######################################
 
     def setup(self):
@@ -447,11 +515,11 @@ class Container(bufferio.Dict):
 
     def pops(self, lis, max_dataS , fileP, fileS = None):
         ''' Replace existing list of blocks of file with new adapted list of blocks '''
-        block = lis[0]
-        listeIndex = self['BLOCKS'].index(lis)
+        block = lis.first
+        listeIndex = next(i for i, item in enumerate(self['BLOCKS']) if item is lis)
         blockGroup = block['GROUP'].value
         if block['DATA'].value is not None:
-            if os.path.exists(fileP):
+            if isinstance(fileP, bytes) or os.path.exists(fileP):      # file path or in memory payload
                 block['DATA'].value = fileP
             else :
                 raise FileExistsError                                   # File does not exist
@@ -464,32 +532,22 @@ class Container(bufferio.Dict):
                             'method' : False}                           #Manually mapping 'wh'
             }
         }
-        newListe = bufferio.BList(False, None,[*BLOCK.generator(self['ATAG'], self.maps, self['BIT']['DATA'][listeIndex], speco, fileS)])
-        if len(newListe) == 0:
-            raise RuntimeError                                          # Generated list is empty
-        self['BIT']['DATA'][listeIndex]['COUNT'].value = len(newListe)
+        newListe = bufferio.BList(False, None, BLOCK.generator(self['ATAG'], self.maps, self['BIT']['DATA'][listeIndex], speco, fileS))
         self['BLOCKS'].pop(listeIndex)
         self['BLOCKS'].insert(listeIndex, newListe)
 
-    def align(self):
-        start = self['BIT']['DATA'][0]['OFFT'].value + self['BIT']['DATA'][0]['TSIZE'].value
-        end = self['BIT']['DATA'][1]['OFFT'].value if len(self['BIT']['DATA']) > 1 else self['ATAG']['TS'].value
-        size = end - start
-        self.output.seek(start, io.SEEK_SET)
-        self.output.write(b'\0'* size)
-
-
-    def manifestUpdate(self, spec, buf, file, actual = False):
+    def manifestUpdate(self, spec, buf, manifest):
         ''' Update old manifest list with new generated one '''
         MAN_list = self['BLOCKS'][0]
-        os.system(spec['flatcP'] + FLATC_ARGS + spec['swp_schema']+ ' ' + file)
-        flatcBin = os.getcwd() +'/'+ os.path.splitext(os.path.basename(file))[0]+'.bin'
-        possibleSize = os.path.getsize(flatcBin) + 100
-        actualSize = os.path.getsize(flatcBin)
-        self.pops(MAN_list, spec['blocks'][0]['data']['args'].get('max_data_size'), flatcBin, (actualSize if actual else possibleSize))
+        schema = flatbuf.Schema.load(spec['swp_schema'])
+        undeclared = [name for name in DELTA if not schema.declares('Artefact', name)]
+        if undeclared:                                                                  # delta fields only in the JSON manifest
+            manifest = dict(manifest, Artefact = [{k: v for k, v in art.items() if k not in undeclared} for art in manifest['Artefact']])
+        flatcBin = schema.encode(manifest)                                              # FlatBuffer of the manifest, serialized in memory
+        self.pops(MAN_list, spec['blocks'][0]['data']['args'].get('max_data_size'), flatcBin)
         MAN_list = self['BLOCKS'][0]
         MAN_list.output = buf
-        return (MAN_list, possibleSize)
+        return MAN_list
 
     def save(self):
         ''' Allocates position and updates BITEntry values'''
@@ -500,16 +558,16 @@ class Container(bufferio.Dict):
         tag['TS'].value = self.size
         tag['TS'].update()
         for rec, fst in zip(bit, self.start_blocks()):
-            grp = rec['GROUP'].value
+            lis = self['BLOCKS'][rec['GROUP'].value - 1]                                                    #grp - 1 : index start with 0 and groups with 1
             rec['OFFT'].value = fst.position
-            rec['COUNT'].value = len(self['BLOCKS'][grp - 1])                                               #grp - 1 : index start with 0 and groups with 1
-            rec['SIZE'].value = sum(blk['DATA'].size for blk in self['BLOCKS'][grp - 1])
-            rec['TSIZE'].value = rec['SIZE'].value + (rec['COUNT'].value * (fst['SIZE'].size + fst['GROUP'].size + fst['SEQ'].size + fst['CRC'].size + fst['CFLAG'].size + fst['PAD'].size + fst['SIG'].size))
+            rec['COUNT'].value = len(lis)
+            rec['TSIZE'].value = lis.size
+            rec['SIZE'].value = rec['TSIZE'].value - (rec['COUNT'].value * (HEAD.size + tag['BSS'].value))    # data without block headers and signatures
             rec.update()
 
-    def sign(self, secpath, signer):
+    def sign(self, secpath, signer, certificate = None):
         ''' Signing of the whole package data'''
-        self['ATAG'].sign(secpath, signer)
+        self['ATAG'].sign(secpath, signer, certificate)
         self['BIT' ].sign(signer)
 
     def verify(self, verifier):
@@ -519,10 +577,11 @@ class Container(bufferio.Dict):
 
     def writeVerification(self):
         ''' #To be write verification. temporary usage => print python values corresponding to output file'''
-        for obj in self['ATAG'].values():
+        tag = self['ATAG']
+        for obj in [tag[name] for name in ATAGHEAD.names] + [tag['SDB']]:
             self.output.seek(obj.position)
             pep = self.output.read(obj.size)
-            if obj != self['ATAG']['SDB']:
+            if obj != tag['SDB']:
                 pepP = struct.unpack(obj.fmt, pep)[0]
                 if pepP != (obj.value):
                     raise RuntimeError
@@ -530,14 +589,16 @@ class Container(bufferio.Dict):
                 if pep != (obj.value):
                     raise RuntimeError
         ATTS = ['SIZE','GROUP','SEQ','CRC','CFLAG']
-        for ATTR in ATTS:
-            for lis in self['BLOCKS']:
-                for blk in lis:
+        for i,lis in enumerate(self['BLOCKS']):
+            for blk in lis:                                                         # header records are rebuilt from a Table, once per block
+                for ATTR in ATTS:
                     self.output.seek(blk[ATTR].position)
                     pep = self.output.read(blk[ATTR].size)
                     pepP = struct.unpack(blk[ATTR].fmt, pep)[0]
                     if pepP != (blk[ATTR].value):
-                        raise RuntimeError(f"AT block {self['BLOCKS'].index(lis)} for {ATTR} found is {pepP} and value is {blk[ATTR].value}")
+                        raise RuntimeError(f"AT block {i} for {ATTR} found is {pepP} and value is {blk[ATTR].value}")
+            for seq in lis.misplaced():                                             # blocks of a group are contiguous
+                raise RuntimeError(f"AT block {i} block {seq} is at {lis[seq].position} instead of {lis.offset(seq)}")
         bit = self['BIT']['DATA']
         for i,item in enumerate(self['BLOCKS']):
             self.output.seek(bit[i]['OFFT'].position)
@@ -547,3 +608,201 @@ class Container(bufferio.Dict):
                 raise RuntimeError
 
 ###############################################################################
+
+class Reader:
+    """
+    Read only access to a package file.
+
+    The file is memory mapped, so packages of any size are inspected without
+    loading them: ATAG and BIT are parsed on open, blocks are read on demand.
+    BIT records give the first block and the count of each group; block
+    payloads differ in size, so the offsets of a group's blocks are collected
+    from their SIZE fields the first time the group is accessed, after which
+    any block is found in constant time.
+
+    maps are the hasher and compressor maps of the package type (see UCM).
+    """
+
+    Block  = collections.namedtuple('Block', ('position',) + HEAD.names + ('SIG', 'DATA'))
+    Record = collections.namedtuple('Record', BITR.names)
+    ATAG   = ATAGHEAD.struct
+    HEAD   = HEAD.struct
+    BITR   = BITR.struct
+
+    def __init__(self, path, maps):
+        self.path = path
+        self.maps = maps
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        if size < self.ATAG.size:
+            self.file.close()
+            raise RuntimeError(f'file size {size} is below the ATAG size')
+        self.map  = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        self.SDB  = self.bit = None
+        try:
+            self.tag  = dict(zip(ATAGHEAD.names, self.ATAG.unpack_from(self.view)))
+            if self.tag['TS'] != len(self.map):
+                raise RuntimeError(f"total size {self.tag['TS']} but file size {len(self.map)}")
+            if not self.ATAG.size <= self.tag['ATAGS'] <= len(self.map):
+                raise RuntimeError(f"ATAGS {self.tag['ATAGS']} exceeds the package")
+            self.SDB  = self.view[self.ATAG.size:self.tag['ATAGS']]
+            self.bit  = self.block_at(self.tag['ATAGS'])
+            if len(self.bit.DATA) % self.BITR.size:
+                raise RuntimeError(f'BIT size {len(self.bit.DATA)} is not a whole number of records')
+        except:
+            self.close()
+            raise
+        self.records = [self.Record(*rec) for rec in self.BITR.iter_unpack(self.bit.DATA)]
+        self.groups  = {rec.GROUP: rec for rec in self.records}
+        self.offsets = {}                                                   # group: array of block positions
+
+    def close(self):
+        self.bit = self.SDB = None
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            pass                                                            # blocks still in use, unmapped once they are gone
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # blocks
+
+    def block_at(self, position):
+        ''' Block at position, payload and signature are memoryviews into the file '''
+        if position + self.HEAD.size > len(self.map):
+            raise RuntimeError(f'block at {position} exceeds the package')
+        head = self.HEAD.unpack_from(self.view, position)
+        sig  = position + self.HEAD.size
+        data = sig + self.tag['BSS']
+        end  = position + head[0]
+        if end > len(self.map) or data > end:
+            raise RuntimeError(f'block at {position} of SIZE {head[0]} exceeds the package')
+        return self.Block(position, *head, self.view[sig:data], self.view[data:end])
+
+    def positions(self, group):
+        ''' Positions of the blocks of group, in SEQ order '''
+        if group not in self.offsets:
+            rec = self.groups[group]
+            offsets = array.array('Q')
+            position = rec.OFFT
+            for seq in range(rec.COUNT):
+                if position + self.HEAD.size > len(self.map):
+                    raise RuntimeError(f'group {group}: block {seq} at {position} exceeds the package')
+                offsets.append(position)
+                (size,) = struct.unpack_from('!Q', self.view, position)
+                if size < self.HEAD.size + self.tag['BSS']:
+                    raise RuntimeError(f'group {group}: block {seq} at {position} has SIZE {size}, below its header')
+                position += size
+            if position - rec.OFFT != rec.TSIZE:
+                raise RuntimeError(f'group {group}: blocks do not match TSIZE')
+            self.offsets[group] = offsets
+        return self.offsets[group]
+
+    def block(self, group, seq):
+        return self.block_at(self.positions(group)[seq])
+
+    def blocks(self, group):
+        for position in self.positions(group):
+            yield self.block_at(position)
+
+    # integrity
+
+    def crc(self, *parts):
+        crc = self.maps['hasher'](1)
+        for part in parts:
+            crc.update(part)
+        return int.from_bytes(crc.digest(), 'big')
+
+    def digest(self, *parts):
+        hasher = self.maps['hasher'](self.tag['BHT'])
+        for part in parts:
+            hasher.update(part)
+        return hasher.digest()
+
+    def check_block(self, blk, verifier = None, name = None):
+        ''' Error message for a block failing its CRC or signature, None if it is sound '''
+        name = name or f'block {blk.GROUP}/{blk.SEQ} at {blk.position}'
+        head = self.view[blk.position:blk.position + self.HEAD.size]
+        if self.tag['CFV'] in (0x0106, 0x0102) and blk.CRC != self.crc(head[:16], head[20:], blk.DATA):
+            return f'{name}: CRC mismatch'
+        if verifier is not None and self.tag['CFV'] in (0x0106, 0x0104) and not verifier(bytes(blk.SIG), self.digest(head, blk.DATA)):
+            return f'{name}: signature verification failed'
+        return None
+
+    @property
+    def certificate(self):
+        ''' Certificate carried by ATAG '''
+        return self.SDB[self.tag['BSS']:-CSS]
+
+    def check_tag(self, verifier = None, certificate_verifier = None):
+        ''' Error messages for ATAG, with the certificate signature, and BIT.
+            The certificate signature is RSA2048 of the key store, checked with
+            certificate_verifier, or verifier when the blocks are RSA2048 too '''
+        errors = []
+        head = self.view[:self.ATAG.size]
+        if self.tag['CFV'] in (0x0106, 0x0102) and self.tag['CRC'] != self.crc(head[:24], head[28:]):
+            errors.append('ATAG: CRC mismatch')
+        if verifier is not None and self.tag['CFV'] in (0x0106, 0x0104):
+            (sig, certificate_sig) = (self.SDB[:self.tag['BSS']], self.SDB[-CSS:])
+            if not verifier(bytes(sig), self.digest(head)):
+                errors.append('ATAG: signature verification failed')
+            if not (certificate_verifier or verifier)(bytes(certificate_sig), hashlib.sha256(self.certificate).digest()):
+                errors.append('ATAG: certificate signature verification failed')
+        error = self.check_block(self.bit, verifier, 'BIT')
+        if error is not None:
+            errors.append(error)
+        return errors
+
+    def check_blocks(self, group, start = 0, stop = None, verifier = None):
+        ''' Error messages for blocks start to stop of group, a group whose blocks
+            cannot be located is reported once, by the range starting at 0 '''
+        errors = []
+        try:
+            positions = self.positions(group)[start:stop]
+        except RuntimeError as error:
+            return [str(error)] if start == 0 else []
+        for seq, position in enumerate(positions, start):
+            try:
+                blk = self.block_at(position)
+            except RuntimeError as error:
+                errors.append(f'group {group}: {error}')
+                continue
+            if (blk.GROUP, blk.SEQ) != (group, seq):
+                errors.append(f'block {blk.GROUP}/{blk.SEQ} at {blk.position}: expected {group}/{seq}')
+            error = self.check_block(blk, verifier)
+            if error is not None:
+                errors.append(error)
+        return errors
+
+    def check(self, verifier = None):
+        ''' Error messages for every part of the package, empty if it is sound '''
+        errors = self.check_tag(verifier)
+        for rec in self.records:
+            errors += self.check_blocks(rec.GROUP, verifier = verifier)
+        return errors
+
+    # payload
+
+    def extract(self, group):
+        ''' Yields the uncompressed payload of a group, block by block '''
+        rec = self.groups[group]
+        compressor = self.maps['compressor'](rec.CALGO)
+        stream = compressor.decompressionObj() if rec.CTYPE == CTYPE.COMPRESSED_WHOLE.value else None
+        for blk in self.blocks(group):
+            if stream is not None:
+                yield stream.decompress(blk.DATA)
+            elif blk.CFLAG == CFLAG.COMPRESSED.value:
+                yield compressor.decompress_data(blk.DATA)
+            else:
+                yield bytes(blk.DATA)
+        if stream is not None and hasattr(stream, 'flush'):
+            yield stream.flush()
+
+###############################################################################
@@ -1,8 +1,10 @@
 import os
 import json
+import hashlib
 import pkg
 from enum import Enum
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 
 ###############################################################################
 
@@ -43,14 +45,21 @@ class UCM(pkg.Container):
     
     @staticmethod
     def initialize_compressor(provider):
-        def compressor(arg):
-            '''Convert from arg value to compressor object'''
+        compressors = {}                                                    # compressors are stateless, shared by equal settings
+        def compressor(arg, profile = None, **settings):
+            '''Convert from arg value to compressor object, tuned with profile and settings'''
             val = {
                     0:      'None',
-                    1:      'zlib'
-                    # 2     :zip        ##Example
+                    1:      'zlib',
+                    2:      'xz',
+                    3:      'bz2',
+                    4:      'zstd',
+                    5:      'lz4'
                     }[arg]
-            return provider(val)
+            key = (val, profile, json.dumps(settings, sort_keys=True))
+            if key not in compressors:
+                compressors[key] = provider(val, profile, **settings)
+            return compressors[key]
         return compressor
 
     @staticmethod
@@ -63,12 +72,20 @@ class UCM(pkg.Container):
                 BTD.UCM_SOFTWARE_MANIFEST            .value: Json,
                 BTD.UCM_SOFTWARE_PACKAGE_BINARY_IMAGE.value: File,
                 BTD.UCM_SOFTWARE_PACKAGE_APPLICATION .value: File,
+                BTD.UCM_SOFTWARE_PACKAGE_BINARY_IMAGE_DELTA.value: File,
+                BTD.UCM_SOFTWARE_PACKAGE_APPLICATION_DELTA .value: File,
                 }[arg]
 
     @staticmethod
-    def artefact_type_map(arg):
-        '''Convert from manifest artefact type to BTD.'''
+    def artefact_type_map(arg, delta = False):
+        '''Convert from manifest artefact type to BTD, delta for artefacts sent as a patch.'''
         BTD = pkg.BTD
+        if delta:
+            return {
+                'Image'         :       BTD.UCM_SOFTWARE_PACKAGE_BINARY_IMAGE_DELTA.value,
+                'Device'        :       BTD.UCM_SOFTWARE_PACKAGE_APPLICATION_DELTA .value,
+                'Application'   :       BTD.UCM_SOFTWARE_PACKAGE_APPLICATION_DELTA .value,
+                }[arg]
         return {
                 'Image'         :       BTD.UCM_SOFTWARE_PACKAGE_BINARY_IMAGE.value,
                 'Device'        :       BTD.UCM_SOFTWARE_PACKAGE_APPLICATION .value,
@@ -93,6 +110,10 @@ class UCM(pkg.Container):
         return {
                 0:              CALGO.NONE.value,
                 1:              CALGO.ZLIB.value,
+                2:              CALGO.XZ.value,
+                3:              CALGO.BZ2.value,
+                4:              CALGO.ZSTD.value,
+                5:              CALGO.LZ4.value,
                 #Maybe additional value ?
                 }[arg]
 
@@ -104,22 +125,32 @@ class UCM(pkg.Container):
     def signer_factory(provider, algorithm, secpath, **kwargs):
         '''Get signer object.'''
         if algorithm == UCM.SignTypeDefinitions.NONE:
-            return { 'sign': lambda _: bytearray(64), 'size': 64 }
+            return { 'sign': lambda _: bytearray(64), 'size': 64, 'fingerprint': 'NONE' }
         elif algorithm == UCM.SignTypeDefinitions.SECP256R1:
             prvkey = provider.loadkey(kwargs['keypath'])
             def sign(digest):
                 sig = provider.generate_signature(prvkey, digest, 'SECP256R1')
                 return sig
-            return { 'sign': sign, 'size': 64 }
+            return { 'sign': sign, 'size': 64, 'fingerprint': 'SECP256R1:' + os.path.abspath(kwargs['keypath']) }
         elif algorithm == UCM.SignTypeDefinitions.RSA2048:
-            key_file = "SecureAuth_End_Entity-priv-key.der"
-            key_path = os.path.join(secpath, key_file)
-            with open(key_path, "rb") as f:
-                private_key = f.read()
+            keys = provider.keystore(secpath)
+            private_key = keys.private_key
             def sign(digest):
                 sig = provider.generate_signature_rsa(private_key, digest)
                 return sig
-            return { 'sign': sign, 'size': 256 }
+            fingerprint = hashlib.sha256(keys.certificate).hexdigest()     # certificate binds the public key
+            jobs = kwargs.get('jobs', 1)
+            if jobs <= 1:
+                return { 'sign': sign, 'size': 256, 'certificate': keys.certificate, 'fingerprint': fingerprint }
+            # worker processes hold the key, the main process only hands out digests
+            pool = ProcessPoolExecutor(max_workers=jobs,
+                                       initializer=_init_sign_worker,
+                                       initargs=(type(provider), secpath))
+            def sign_all(digests):
+                chunksize = max(1, len(digests) // (jobs * 4))
+                return list(pool.map(_sign_worker, digests, chunksize=chunksize))
+            return { 'sign': sign, 'size': 256, 'certificate': keys.certificate, 'fingerprint': fingerprint,
+                     'sign_all': sign_all, 'batch': 64 * jobs, 'close': pool.shutdown }     # close() stops the workers
         else:
             raise RuntimeError('Unknown signature algorithm')
 
@@ -135,10 +166,7 @@ class UCM(pkg.Container):
                 return provider.verification(pubkey, digest, 'SECP256R1', sig)
             return verify
         elif algorithm == UCM.SignTypeDefinitions.RSA2048:
-            pubkey_file = "SecureAuth_End_Entity-pub-key.der"
-            key_path = os.path.join(secpath, pubkey_file)
-            with open(key_path, "rb") as f:
-                pubkey = f.read()
+            pubkey = provider.keystore(secpath).public_key
             def verify(sig, digest):
                 return provider.verify_signature_rsa(pubkey, digest, sig)
             return verify
@@ -156,6 +184,10 @@ class UCM(pkg.Container):
                 }
         super().__init__()
 
+    def open(self, path):
+        '''Read an existing package, see pkg.Reader.'''
+        return pkg.Reader(path, self.maps)
+
     def generate(self, spec_, secpath, **kwargs):
         '''Convert from manifest and artefact to IDENT and blocks.'''
         BTD  = pkg.BTD
@@ -234,7 +266,7 @@ class UCM(pkg.Container):
                         raise TypeError(" Given artefact type in update manifest does not correspond to actual artefact type")
                 #IDENT = BTD.UCM_SOFTWARE_PACKAGE_APPLICATION.value # UCM.artefact_type_map(sp_man['artefact_type'])      # Define type kImage, kApp ...             ERR TO BE ADDRESSED
                 blocks.append({
-                    'IDENT': UCM.artefact_type_map(man['updateType']),
+                    'IDENT': UCM.artefact_type_map(man['updateType'], art.get('delta') is not None),
                     'GROUP': idx,
                     'SEQ':   1,
                     'CTYPE': UCM.compression_type_map(art['method']),
@@ -248,3 +280,17 @@ class UCM(pkg.Container):
         super().generate(spec, secpath, **kwargs)
 
 ###############################################################################
+
+# signing pool workers, module level to be picklable
+
+_worker = {}
+
+def _init_sign_worker(provider, secpath):
+    '''Load the private key once per worker process.'''
+    _worker['provider'] = provider()
+    _worker['key'] = _worker['provider'].keystore(secpath).private_key
+
+def _sign_worker(digest):
+    return _worker['provider'].generate_signature_rsa(_worker['key'], digest)
+
+###############################################################################
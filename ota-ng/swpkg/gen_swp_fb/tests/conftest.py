@@ -0,0 +1,46 @@
+import os
+import sys
+import json
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import gen_swp_fb
+
+KEYS   = os.path.join(os.path.dirname(HERE), 'keys')
+SCHEMA = os.path.join(HERE, 'data', 'manifest.fbs')
+
+
+def manifest(names):
+    ''' Update manifest of artefacts with placeholder sizes '''
+    return {'SWPackage': [{'actionType': 'Install', 'uncompressedSoftwareClusterSize': 0,
+                           'estimatedDurationOfOperation': 0, 'compressedSoftwarePackageSize': 0}],
+            'Artefact': [{'name': name, 'compressionType': 'None', 'archiveType': 'None', 'updateType': 'Application',
+                          'compressedSize': 0, 'uncompressedSize': 0} for name in names]}
+
+@pytest.fixture
+def build(tmp_path):
+    ''' build(artefacts, **options) generates a package of artefacts, a list of
+        (name, data, method[, config entries]), with gen_swp_fb options and returns its path '''
+    def build(artefacts, **options):
+        for (name, data, *_) in artefacts:
+            (tmp_path / name).write_bytes(data)
+        (tmp_path / 'manifest.json').write_text(json.dumps(options.pop('manifest', None) or manifest([name for name, *_ in artefacts])))
+        args = vars(gen_swp_fb.arg_parser().parse_args([]))
+        args.update(container_format = '0x0106',
+                    update_manifest_data = str(tmp_path / 'manifest.json'),
+                    update_manifest_schema = SCHEMA,
+                    artefacts = [dict({'value': str(tmp_path / name), 'method': method}, **(extra[0] if extra else {}))
+                                 for (name, data, method, *extra) in artefacts],
+                    compress = 'zlib',
+                    key_store = KEYS,
+                    block_size = 4000,
+                    estimated_speed = 100,
+                    output = str(tmp_path / 'out' / 'swpkg.bin'))
+        args.update(options)
+        try:
+            return gen_swp_fb.generate(args)
+        finally:
+            gen_swp_fb.release()
+    return build
@@ -0,0 +1,58 @@
+import os
+import pytest
+import bufferio
+
+
+def entries(cache, suffix = ''):
+    ''' Block entries, or artefact entries with suffix .keys '''
+    return sorted(entry.path for sub in os.scandir(cache) for entry in os.scandir(sub.path)
+                  if entry.name.endswith('.keys') == (suffix == '.keys'))
+
+@pytest.mark.parametrize('jobs', [1, 2])
+@pytest.mark.parametrize('verification', ['on', 'off'])
+def test_corrupt_entries_are_rebuilt(build, tmp_path, capsys, jobs, verification):
+    cache = str(tmp_path / 'cache')
+    artefacts = [('app.bin', os.urandom(40000), 'compressChunks'), ('lib.bin', bytes(40000), 'compressWhole')]
+    path = build(artefacts, cache = cache)
+    with open(path, 'rb') as f:
+        package = f.read()
+    corrupt = entries(cache)[:5]
+    for entry in corrupt:
+        with open(entry, 'r+b') as f:
+            f.truncate(os.path.getsize(entry) - 7)
+    capsys.readouterr()
+    assert build(artefacts, cache = cache, jobs = jobs, verification = verification) == path
+    with open(path, 'rb') as f:
+        assert f.read() == package
+    stats = capsys.readouterr().out
+    assert f'block cache: {len(entries(cache)) - 5} hits, 5 misses' in stats
+    assert all(os.path.getsize(entry) > 0 for entry in corrupt)          # stored again
+
+def test_unchanged_whole_artefact_is_not_compressed(build, tmp_path, capsys, monkeypatch):
+    cache = str(tmp_path / 'cache')
+    artefacts = [('app.bin', os.urandom(30000), 'compressWhole')]
+    path = build(artefacts, cache = cache)
+    with open(path, 'rb') as f:
+        package = f.read()
+    monkeypatch.setattr(bufferio.Chunker, 'push', lambda *args: pytest.fail('compressed again'))
+    capsys.readouterr()
+    build(artefacts, cache = cache, jobs = 2)
+    with open(path, 'rb') as f:
+        assert f.read() == package
+    assert f'block cache: {len(entries(cache))} hits, 0 misses' in capsys.readouterr().out
+
+def test_corrupt_whole_payload_is_compressed_again(build, tmp_path):
+    cache = str(tmp_path / 'cache')
+    artefacts = [('app.bin', os.urandom(30000), 'compressWhole')]
+    path = build(artefacts, cache = cache)
+    with open(path, 'rb') as f:
+        package = f.read()
+    for entry in entries(cache):                                        # same size, CRC and signature, other payload
+        with open(entry, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 1]))
+    build(artefacts, cache = cache)
+    with open(path, 'rb') as f:
+        assert f.read() == package
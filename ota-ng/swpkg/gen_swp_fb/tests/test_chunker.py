@@ -0,0 +1,63 @@
+import random
+import hashlib
+import zlib
+import pytest
+from bufferio import Chunker
+
+
+class Bursts:
+    ''' Deterministic stand-in of a buffering compressor: holds its input back
+        and releases it every third call, so its output lags the blocks '''
+
+    def __init__(self):
+        (self.held, self.calls) = (b'', 0)
+
+    def compress(self, data):
+        (self.held, self.calls) = (self.held + data[::2], self.calls + 1)
+        if self.calls % 3:
+            return b''
+        (ret, self.held) = (self.held, b'')
+        return ret
+
+    def flush(self):
+        (ret, self.held) = (self.held, b'')
+        return ret
+
+def payloads(data, size, chunker):
+    ''' Block payloads of each input chunk of size, as BList.cut pushes them '''
+    return [chunker.push(data[offset:offset + size], size, offset + size >= len(data))
+            for offset in range(0, len(data), size)]
+
+def file_read(data, size, provider):
+    ''' Compressed stream of the compress-whole File.read the Chunker replaced '''
+    return b''.join(provider.compress(data[offset:offset + size]) for offset in range(0, len(data), size)) + provider.flush()
+
+def text(n, seed = 7):
+    ''' Compressible input, words of a small vocabulary '''
+    rnd = random.Random(seed)
+    words = [bytes(rnd.choices(b'abcdefghijklmnopqrstuvwxyz', k = rnd.randint(2, 9))) for _ in range(500)]
+    data = bytearray()
+    while len(data) < n:
+        data += rnd.choice(words) + b' '
+    return bytes(data[:n])
+
+GOLDEN = text(200000)
+
+@pytest.mark.parametrize('provider', [lambda: zlib.compressobj(9), Bursts])
+@pytest.mark.parametrize('size', [7, 512, 4000, 60000])
+def test_chunker_cuts_the_stream_in_blocks(size, provider):
+    blocks = [block for pushed in payloads(GOLDEN, size, Chunker(provider())) for block in pushed]
+    stream = file_read(GOLDEN, size, provider())
+    assert b''.join(blocks) == stream
+    assert [len(block) for block in blocks] == [size] * (len(stream) // size) + ([len(stream) % size] if len(stream) % size else [])
+
+def test_chunker_payloads_golden():
+    pushed = payloads(GOLDEN, 4000, Chunker(Bursts()))
+    assert [len(blocks) for blocks in pushed] == [0, 0, 1, 0, 0, 2] * 8 + [0, 1]
+    assert hashlib.sha256(b''.join(block for blocks in pushed for block in blocks)).hexdigest() == \
+           'caca7654e759791ffb6c792058938a5a0b0a6ad41899bf317128c14502dce283'
+
+def test_expanding_stream_never_exceeds_the_block_size():
+    pushed = payloads(random.Random(3).randbytes(100000), 4000, Chunker(zlib.compressobj(9)))
+    assert max(len(block) for blocks in pushed for block in blocks) == 4000
+    assert sum(len(blocks) for blocks in pushed) > 25                          # more blocks than input chunks
@@ -0,0 +1,19 @@
+import os
+import random
+import pytest
+import de_compress
+import verify
+from conftest import KEYS
+
+
+TEXT = b' '.join(random.Random(5).choice([b'block', b'size', b'limit', b'payload', b'stream']) for _ in range(40000))
+
+@pytest.mark.parametrize('algorithm', sorted(de_compress.BACKENDS))
+@pytest.mark.parametrize('data', [os.urandom(120000), TEXT], ids = ['random', 'text'])
+def test_whole_payloads_fit_the_block_size(build, algorithm, data):
+    # xz, bz2, zstd and lz4 hold their output back, the chunker must still cut it in blocks of the block size
+    path = build([('app.bin', data, 'compressWhole')], compress = algorithm, block_size = 3000)
+    package = verify.reader(path, KEYS)
+    group = package.records[1].GROUP
+    assert max(len(blk.DATA) for blk in package.blocks(group)) <= 3000
+    assert b''.join(package.extract(group)) == data
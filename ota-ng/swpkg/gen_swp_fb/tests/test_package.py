@@ -0,0 +1,78 @@
+import os
+import json
+import hashlib
+import pytest
+import flatbuf
+import verify
+import pkg
+from conftest import KEYS, SCHEMA
+
+
+def test_manifest_larger_than_its_first_encoding(build, tmp_path):
+    # placeholder sizes of 0 are left out of the first FlatBuffer, the real
+    # ones make the final manifest grow by far more than the 100 bytes the
+    # generator used to reserve for it in front of the artefacts
+    artefacts = [(f'app{n}.bin', os.urandom(3000 + n * 1000), 'compressChunks') for n in range(12)]
+    path = build(artefacts)
+    manifest = json.loads((tmp_path / 'out' / 'enriched_update_manifest.json').read_text())
+    assert all(art['uncompressedSize'] for art in manifest['Artefact'])
+    package = verify.reader(path, KEYS)
+    assert package.check(verify.security(KEYS)[1]) == []
+    assert b''.join(package.extract(package.records[0].GROUP)) == flatbuf.Schema.load(SCHEMA).encode(manifest)
+    for rec, (name, data, method) in zip(package.records[1:], artefacts):
+        assert b''.join(package.extract(rec.GROUP)) == data
+
+@pytest.mark.parametrize('declared', [True, False])
+def test_delta_manifest_keeps_the_artefact_size(build, tmp_path, declared):
+    schema = SCHEMA
+    if not declared:                                                    # schema without the delta fields
+        schema = str(tmp_path / 'plain.fbs')
+        with open(SCHEMA) as f, open(schema, 'w') as g:
+            g.write(f.read().replace(' patchSize: ulong; deltaUpdate: bool; deltaBaseHash: string;', ''))
+    old = os.urandom(50000)
+    new = old[:20000] + os.urandom(300) + old[20000:]
+    (tmp_path / 'prev').mkdir()
+    (tmp_path / 'prev' / 'app.bin').write_bytes(old)
+    path = build([('app.bin', new, 'compressChunks'), ('lib.bin', bytes(7000), 'compressChunks')],
+                 delta_base = str(tmp_path / 'prev'), update_manifest_schema = schema, estimated_speed = 1)
+    manifest = json.loads((tmp_path / 'out' / 'enriched_update_manifest.json').read_text())
+    (app, lib) = manifest['Artefact']
+    assert app['uncompressedSize'] == len(new)
+    assert app['deltaUpdate'] is True and app['deltaBaseHash'] == hashlib.sha256(old).hexdigest()
+    assert app['patchSize'] < 1000
+    assert 'deltaUpdate' not in lib and lib['uncompressedSize'] == 7000
+    assert manifest['SWPackage'][0]['uncompressedSoftwareClusterSize'] == len(new) + 7000
+    assert manifest['SWPackage'][0]['estimatedDurationOfOperation'] == round((len(new) + 7000) / 1000)
+    package = verify.reader(path, KEYS)
+    if not declared:
+        for art in manifest['Artefact']:
+            for name in ('patchSize', 'deltaUpdate', 'deltaBaseHash'):
+                art.pop(name, None)
+    assert b''.join(package.extract(package.records[0].GROUP)) == flatbuf.Schema.load(schema).encode(manifest)
+
+@pytest.mark.parametrize('method', ['compressWhole', 'compressChunks'])
+@pytest.mark.parametrize('data', [os.urandom(50000), bytes(50000), os.urandom(1000)])
+def test_payloads_fit_the_block_size(build, method, data):
+    path = build([('app.bin', data, method)], block_size = 4000)
+    package = verify.reader(path, KEYS)
+    for rec in package.records:
+        assert all(len(blk.DATA) <= 4000 for blk in package.blocks(rec.GROUP))
+    assert b''.join(package.extract(package.records[1].GROUP)) == data
+
+def test_missing_explicit_delta_base(build, tmp_path):
+    # named in the config, so not silently sent in full
+    with pytest.raises(FileNotFoundError, match = 'app.bin: delta base .* not found'):
+        build([('app.bin', os.urandom(5000), 'compressChunks', {'base': str(tmp_path / 'prev' / 'app.bin')})])
+
+def test_full_check_replaces_the_read_back(build, monkeypatch, capsys):
+    monkeypatch.setattr(pkg.Container, 'writeVerification', lambda package: pytest.fail('read back'))
+    build([('app.bin', os.urandom(9000), 'compressChunks')])
+    assert 'verified' in capsys.readouterr().out
+
+@pytest.mark.parametrize('algorithm', ['zlib', 'xz', 'lz4'])
+@pytest.mark.parametrize('mmap', [False, True])
+def test_empty_whole_artefact(build, algorithm, mmap):
+    path = build([('empty.bin', b'', 'compressWhole'), ('app.bin', os.urandom(5000), 'compressWhole')], compress = algorithm, mmap = mmap)
+    package = verify.reader(path, KEYS)
+    assert len(list(package.blocks(package.records[1].GROUP))) == 1
+    assert b''.join(package.extract(package.records[1].GROUP)) == b''
@@ -0,0 +1,16 @@
+import os
+import json
+import pytest
+import phases
+
+
+def test_cover_counts_bytes_once():
+    spans = []
+    assert [phases.cover(spans, *span) for span in [(0, 10), (10, 20), (5, 15), (30, 40), (25, 35), (0, 50)]] == [10, 10, 0, 10, 5, 15]
+    assert spans == [(0, 50)]
+
+def test_write_bytes_add_up_to_the_package_size(build, tmp_path):
+    path = build([('app.bin', os.urandom(30000), 'compressChunks'), ('lib.bin', bytes(30000), 'compressWhole')], profile = True)
+    with open(tmp_path / 'out' / 'swpkg_profile.json') as f:
+        report = json.load(f)
+    assert report['phases']['write']['bytes'] == os.path.getsize(path)
@@ -0,0 +1,35 @@
+import os
+import hashlib
+import pytest
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, padding, utils
+from conftest import KEYS
+from gensignature import KeyStore, SignatureGen as SEC
+import gen_swp_fb
+import swp
+import pkg
+
+
+def test_release_shuts_down_the_signing_pool():
+    (signer, verifier, hasher_map) = gen_swp_fb.security(KEYS, 2)
+    assert len(signer['sign_all']([bytes(32)] * 4)) == 4
+    gen_swp_fb.release()
+    assert gen_swp_fb.tools == {}
+    with pytest.raises(RuntimeError):                                       # workers are gone
+        signer['sign_all']([bytes(32)])
+
+@pytest.mark.parametrize('algorithm', ['RSA2048', 'SECP256R1', 'NONE'])
+def test_certificate_is_signed_with_the_key_store_key(build, tmp_path, monkeypatch, algorithm):
+    secp = ec.generate_private_key(ec.SECP256R1())
+    keypath = tmp_path / 'keypair.txt'
+    keypath.write_text('Private key :0x%x\nPublic key  :0x00\n' % secp.private_numbers().private_value)
+    sec = SEC()
+    sec.alg = 'SHA256'                                                      # ECDSA hash, set by the hasher when used by the tool
+    signer = swp.UCM.signer_factory(sec, swp.UCM.SignTypeDefinitions[algorithm], KEYS, keypath = str(keypath))
+    monkeypatch.setattr(gen_swp_fb, 'security', lambda secpath, jobs = 1: (signer, None, swp.UCM.hasher_map_factory(SEC())))
+    path = build([('app.bin', os.urandom(10000), 'compressChunks')], verification = 'off')
+    keys = KeyStore.load(KEYS)
+    with pkg.Reader(path, {'hasher': swp.UCM.hasher_map_factory(SEC())}) as package:
+        assert bytes(package.certificate) == keys.certificate
+        keys.public_key.verify(bytes(package.SDB[-pkg.CSS:]), hashlib.sha256(keys.certificate).digest(),
+                               padding.PKCS1v15(), utils.Prehashed(hashes.SHA256()))
@@ -0,0 +1,45 @@
+import os
+import struct
+import pytest
+import verify
+from conftest import KEYS
+
+
+@pytest.fixture
+def package(build):
+    ''' Path of a sound package and the position of its second artefact block '''
+    path = build([('app.bin', os.urandom(20000), 'compressChunks')])
+    with verify.security(KEYS)[0].open(path) as reader:
+        position = reader.positions(reader.records[1].GROUP)[1]
+        tsize = reader.tag['ATAGS'] + reader.HEAD.size + reader.tag['BSS'] + reader.BITR.size + 8   # TSIZE of the artefact record
+    return (path, position, tsize)
+
+def patch(path, position, fmt, value):
+    with open(path, 'r+b') as f:
+        f.seek(position)
+        f.write(struct.pack(fmt, value))
+
+def test_sound_package(package):
+    assert verify.verify(package[0], KEYS)[0] == []
+
+@pytest.mark.parametrize('size', [0, 3, 2**40, 2**64 - 1])
+@pytest.mark.parametrize('workers', [1, 2])
+def test_corrupt_block_size(package, size, workers):
+    (path, position, tsize) = package
+    patch(path, position, '!Q', size)
+    errors = verify.verify(path, KEYS, workers)[0]
+    assert len(errors) == 1 and ('SIZE' in errors[0] or 'exceeds' in errors[0])
+
+def test_corrupt_group_size(package):
+    (path, position, tsize) = package
+    patch(path, tsize, '!Q', 2**40)
+    errors = verify.verify(path, KEYS)[0]
+    assert 'BIT: CRC mismatch' in errors and any('TSIZE' in error for error in errors)
+
+@pytest.mark.parametrize('size', [0, 30, 2000, -100])
+def test_truncated_package(package, size):
+    path = package[0]
+    with open(path, 'r+b') as f:
+        f.truncate(size if size >= 0 else os.path.getsize(path) + size)
+    errors = verify.verify(path, KEYS)[0]
+    assert len(errors) == 1
@@ -0,0 +1,119 @@
+'''Offline verification of generated packages
+
+Usage:
+
+    verify.py <swpkg.bin> [<swpkg.bin> ...] [--key-store <keys>] [--workers <n>]
+
+Checks the CRC and RSA2048 signature of ATAG, BIT and every block, the
+certificate carried by ATAG against the key store, and the block sequence of
+every group. Blocks are checked by a pool of worker processes, each mapping
+the package once. Exits with 1 if any package fails.
+'''
+
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+from cryptography import x509
+import swp
+import de_compress
+from gensignature import SignatureGen as SEC
+
+
+TASK = 1024                                                                 # blocks per worker task
+
+###############################################################################
+# package readers and verifiers, created once per process
+
+tools   = {}
+readers = {}
+
+def security(secpath):
+    ''' Returns (package type, verifier, key store) for a key store '''
+    key = os.path.abspath(secpath)
+    if key not in tools:
+        sec      = SEC()
+        verifier = swp.UCM.verifier_factory(sec,
+                        swp.UCM.SignTypeDefinitions.RSA2048,
+                        secpath,
+                        keypath = 'ucm_dev_keypair.txt')
+        ucm      = swp.UCM(hasher_map = swp.UCM.hasher_map_factory(sec),
+                           compressor = swp.UCM.initialize_compressor(de_compress.Compress))
+        tools[key] = (ucm, verifier, sec.keystore(secpath))
+    return tools[key]
+
+def reader(path, secpath):
+    key = (os.path.abspath(path), os.path.abspath(secpath))
+    if key not in readers:
+        readers[key] = security(secpath)[0].open(path)
+    return readers[key]
+
+def check_range(path, secpath, group, start, stop):
+    ''' Worker task, error messages for blocks start to stop of group '''
+    return reader(path, secpath).check_blocks(group, start, stop, security(secpath)[1])
+
+###############################################################################
+
+def check_certificate(package, keys):
+    ''' Returns (errors, warnings) for the certificate carried by ATAG '''
+    try:
+        certificate = x509.load_der_x509_certificate(bytes(package.certificate))
+    except ValueError:
+        return (['ATAG: certificate cannot be parsed'], [])
+    errors = []
+    warnings = []
+    if certificate.public_key().public_numbers() != keys.public_key.public_numbers():
+        errors.append('ATAG: certificate does not match the key store')
+    now = datetime.now(timezone.utc)
+    if not certificate.not_valid_before_utc <= now <= certificate.not_valid_after_utc:
+        warnings.append(f'ATAG: certificate valid from {certificate.not_valid_before_utc:%Y-%m-%d} to {certificate.not_valid_after_utc:%Y-%m-%d}')
+    return (errors, warnings)
+
+def verify(path, secpath, workers = 1):
+    ''' Returns (errors, warnings, package size, seconds) of a full check of a package '''
+    start = time.perf_counter()
+    (ucm, verifier, keys) = security(secpath)
+    try:
+        package = ucm.open(path)
+    except RuntimeError as error:                                       # ATAG or BIT unreadable
+        return ([str(error)], [], os.path.getsize(path), time.perf_counter() - start)
+    with package:
+        errors = package.check_tag(verifier)
+        if package.tag['CFV'] in (0x0106, 0x0104):
+            (certificate_errors, warnings) = check_certificate(package, keys)
+            errors += certificate_errors
+        else:
+            warnings = []
+        size = package.tag['TS']
+        tasks = [(rec.GROUP, first, first + TASK) for rec in package.records for first in range(0, rec.COUNT, TASK)]
+        if workers <= 1:
+            for (group, first, last) in tasks:
+                errors += package.check_blocks(group, first, last, verifier)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(check_range, path, secpath, *task) for task in tasks]
+                for future in futures:
+                    errors += future.result()
+    return (errors, warnings, size, time.perf_counter() - start)
+
+###############################################################################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify generated packages")
+    parser.add_argument("package", nargs='+', help="Path to a swpkg.bin")
+    parser.add_argument("--key-store", type=str, default=".", help="Path to the keystore, directory containing .der files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of processes checking blocks")
+    args = parser.parse_args()
+
+    failed = 0
+    for path in args.package:
+        (errors, warnings, size, seconds) = verify(path, args.key_store, args.workers)
+        for message in warnings:
+            print(f'{path}: warning, {message}')
+        for message in errors:
+            print(f'{path}: {message}')
+        print(f'{path}: {"failed" if errors else "ok"}, {size} bytes in {seconds:.2f} s ({size / seconds / 2**20:.1f} MB/s)')
+        failed += bool(errors)
+    sys.exit(1 if failed else 0)